@@ -0,0 +1,161 @@
+#########################################################
+#
+#   Title : Adaptive integrator for the "cosmic ballet" application
+#   Author: Joanne Breitfelder
+#
+#   Description :
+#   This script solves the 3 bodies problem with an
+#   adaptive step Runge-Kutta method (Dormand-Prince 5(4)).
+#   The step is adjusted so that the estimated local error
+#   stays below atol + rtol*|q|; it becomes small during
+#   close encounters and large when nothing happens.
+#   The dense output (4th order interpolation) gives the
+#   solution at any requested time, without shortening
+#   the steps.
+#
+#########################################################
+
+import numpy as np
+import CB_core
+
+
+#########################################################
+### Dormand-Prince coefficients
+#########################################################
+
+## Nodes (unused: the equations do not depend on time)
+C = np.array([0, 1./5, 3./10, 4./5, 8./9, 1])
+A = [[],
+     [1./5],
+     [3./40, 9./40],
+     [44./45, -56./15, 32./9],
+     [19372./6561, -25360./2187, 64448./6561, -212./729],
+     [9017./3168, -355./33, 46732./5247, 49./176, -5103./18656]]
+B = np.array([35./384, 0, 500./1113, 125./192, -2187./6784, 11./84])
+E = np.array([71./57600, 0, -71./16695, 71./1920, -17253./339200, 22./525, -1./40])
+
+## Coefficients of the dense output polynomial (powers 1 to 4 of
+## the fraction of step), one line per stage
+P = np.array([
+    [1, -8048581381./2820520608, 8663915743./2820520608, -12715105075./11282082432],
+    [0, 0, 0, 0],
+    [0, 131558114200./32700410799, -68118460800./10900136933, 87487479700./32700410799],
+    [0, -1754552775./470086768, 14199869525./1410260304, -10690763975./1880347072],
+    [0, 127303824393./49829197408, -318862633887./49829197408, 701980252875./199316789632],
+    [0, -282668133./205662961, 2019193451./616988883, -1453857185./822651844],
+    [0, 40617522./29380423, -110615467./29380423, 69997945./29380423]])
+
+
+#########################################################
+### Main functions
+#########################################################
+
+def dopri_step(x, k1, m, fx, dt):
+
+    ##########
+    ##  One Dormand-Prince step (not yet accepted)
+    ##  x is a position/velocity vector, k1 = fx(x, m)
+    ##  m contains the bodies masses
+    ##  fx is the differential function to solve
+    ##  Returns the new vector, the error estimate and
+    ##  the 7 stages (the last one is fx at the new vector)
+    ##########
+
+    K = np.empty((7, x.shape[0]))
+    K[0] = k1
+    for s in range(1, 6):
+        K[s] = fx(x+dt*np.dot(A[s], K[:s]), m)
+    x_new = x+dt*np.dot(B, K[:6])
+    K[6] = fx(x_new, m)
+    err = dt*np.dot(E, K)
+    return x_new, err, K
+
+def dense_output(x, K, dt, theta):
+
+    ##########
+    ##  Interpolates inside an accepted step
+    ##  x is the vector at the beginning of the step
+    ##  K contains the 7 stages of the step
+    ##  theta is an array of fractions of the step (between 0 and 1)
+    ##########
+
+    theta = np.asarray(theta, dtype=float)
+    powers = np.cumprod(np.repeat(theta[:, None], 4, axis=1), axis=1)
+    return x+dt*np.dot(powers, np.dot(K.T, P).T)
+
+def integrate_adaptive(q, m, tfin, t_out=None, rtol=1e-9, atol=1e-12,
+                       dt=None, fx=CB_core.diff_eq, max_steps=10**7):
+
+    ##########
+    ##  Solves the equations from t=0 to tfin with an adaptive step
+    ##  q is the initial position/velocity vector
+    ##  m contains the bodies masses
+    ##  t_out is the time grid where the solution is wanted
+    ##  (strictly increasing, in ]0, tfin], else ValueError is
+    ##  raised); if None, the solution is returned at the end
+    ##  of every accepted step
+    ##  rtol, atol are the relative and absolute tolerances
+    ##  dt is the first trial step (0.5% of tfin if None : the
+    ##  next steps are adapted to the error anyway)
+    ##  Returns t, the (len(t), len(q)) array of solutions and a
+    ##  dictionnary of statistics (accepted/rejected steps and
+    ##  number of evaluations of fx)
+    ##########
+
+    x = np.array(q, dtype=float)
+    tfin = float(tfin)
+    if t_out is not None:
+        t_out = np.asarray(t_out, dtype=float)
+        if t_out.ndim!=1 or np.any(np.diff(t_out)<=0):
+            raise ValueError('t_out must be a strictly increasing list of times')
+        if t_out.shape[0]>0 and (t_out[0]<=0 or t_out[-1]>tfin):
+            raise ValueError('t_out must be in ]0, tfin] (tfin = %g)' % tfin)
+        q_out = np.empty((t_out.shape[0], x.shape[0]))
+        j = 0
+    else:
+        t_list, q_list = [], []
+    if dt is None:
+        dt = 0.005*tfin
+
+    k1 = fx(x, m)
+    t = 0.
+    rejected = False
+    stats = {'accepted' : 0, 'rejected' : 0, 'nfev' : 1}
+    while t<tfin:
+        if stats['accepted']+stats['rejected']>=max_steps:
+            raise RuntimeError('Too many steps in integrate_adaptive (t = %g)' % t)
+        dt = min(dt, tfin-t)
+        x_new, err, K = dopri_step(x, k1, m, fx, dt)
+        stats['nfev'] += 6
+
+        scale = atol+rtol*np.maximum(np.abs(x), np.abs(x_new))
+        err_norm = np.sqrt(np.mean((err/scale)**2))
+        if err_norm>1:
+            stats['rejected'] += 1
+            dt = dt*max(0.2, 0.9*err_norm**(-0.2))
+            rejected = True
+            continue
+
+        t_new = t+dt if dt<tfin-t else tfin
+        if t_out is not None:
+            j_new = np.searchsorted(t_out, t_new, side='right')
+            if j_new>j:
+                q_out[j:j_new] = dense_output(x, K, dt, (t_out[j:j_new]-t)/dt)
+                j = j_new
+        else:
+            t_list.append(t_new)
+            q_list.append(x_new)
+
+        stats['accepted'] += 1
+        t, x, k1 = t_new, x_new, K[6]
+        ## No growth just after a rejected step
+        if rejected:
+            rejected = False
+        elif err_norm==0:
+            dt = dt*10
+        else:
+            dt = dt*min(10., max(0.2, 0.9*err_norm**(-0.2)))
+
+    if t_out is not None:
+        return t_out, q_out, stats
+    return np.array(t_list), np.array(q_list), stats
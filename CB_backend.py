@@ -0,0 +1,127 @@
+#########################################################
+#
+#   Title : Computation backends for the "cosmic ballet" application
+#   Author: Joanne Breitfelder
+#
+#   Description :
+#   This script gives the choice of the function used
+#   to solve the 3 bodies problem (the "backend") :
+#   - 'numpy' : CB_core.integrate (always available)
+#   - 'numba' : diff_eq and the whole Runge-Kutta loop
+#     compiled in one function (needs the numba package)
+#   Both backends give exactly the same trajectory.
+#
+#   Usage :
+#   integrate = CB_backend.get_backend()  ## best available
+#   q_all = integrate(q, params['mass'], dt, number)
+#
+#########################################################
+
+import numpy as np
+import CB_core
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+#########################################################
+### Compiled functions
+#########################################################
+
+if numba is not None:
+
+    @numba.njit(cache=True)
+    def diff_eq_numba(q, m, qp):
+
+        ##########
+        ##  Same as CB_core.diff_eq (same order of operations),
+        ##  the derivative is written in qp
+        ##########
+
+        c=3./2.
+        G=9.86e-5 ## In the right units
+
+        x1, y1, x2, y2, x3, y3 = q[0], q[1], q[2], q[3], q[4], q[5]
+
+        m1m2=((x2-x1)*(x2-x1)+(y2-y1)*(y2-y1))**c
+        m1m3=((x3-x1)*(x3-x1)+(y3-y1)*(y3-y1))**c
+        m2m3=((x3-x2)*(x3-x2)+(y3-y2)*(y3-y2))**c
+
+        for i in range(6):
+            qp[i] = q[i+6]
+
+        qp[6] = G*(m[1]*(x2-x1)/m1m2+m[2]*(x3-x1)/m1m3)
+        qp[7] = G*(m[1]*(y2-y1)/m1m2+m[2]*(y3-y1)/m1m3)
+
+        qp[8] = G*(m[0]*(x1-x2)/m1m2+m[2]*(x3-x2)/m2m3)
+        qp[9] = G*(m[0]*(y1-y2)/m1m2+m[2]*(y3-y2)/m2m3)
+
+        qp[10] = G*(m[0]*(x1-x3)/m1m3+m[1]*(x2-x3)/m2m3)
+        qp[11] = G*(m[0]*(y1-y3)/m1m3+m[1]*(y2-y3)/m2m3)
+
+    @numba.njit(cache=True)
+    def integrate_numba(q, m, dt, number, q_all):
+
+        ##########
+        ##  Same as CB_core.integrate (Runge-Kutta method),
+        ##  the trajectory is written in the (number, 12) q_all
+        ##########
+
+        x = q.copy()
+        xk = np.empty(12)
+        k1, k2, k3, k4 = np.empty(12), np.empty(12), np.empty(12), np.empty(12)
+        for j in range(number):
+            diff_eq_numba(x, m, k1)
+            for i in range(12):
+                k1[i] = k1[i]*dt
+                xk[i] = x[i]+k1[i]*0.5
+            diff_eq_numba(xk, m, k2)
+            for i in range(12):
+                k2[i] = k2[i]*dt
+                xk[i] = x[i]+k2[i]*0.5
+            diff_eq_numba(xk, m, k3)
+            for i in range(12):
+                k3[i] = k3[i]*dt
+                xk[i] = x[i]+k3[i]
+            diff_eq_numba(xk, m, k4)
+            for i in range(12):
+                k4[i] = k4[i]*dt
+                x[i] = x[i]+(k1[i]+2*(k2[i]+k3[i])+k4[i])/6
+                q_all[j, i] = x[i]
+
+
+#########################################################
+### Backends
+#########################################################
+
+def integrate_jit(q, m, dt, number):
+
+    ##########
+    ##  Solves the equations with the compiled functions
+    ##  (same arguments and result as CB_core.integrate)
+    ##########
+
+    q_all = np.empty((number, 12))
+    integrate_numba(np.array(q, dtype=float), np.array(m, dtype=float),
+                    float(dt), number, q_all)
+    return q_all
+
+backends = {'numpy' : CB_core.integrate}
+if numba is not None:
+    backends['numba'] = integrate_jit
+
+def get_backend(name=None):
+
+    ##########
+    ##  Returns the integration function of a backend
+    ##  name is 'numpy' or 'numba' ; if None, the fastest
+    ##  available backend is chosen
+    ##########
+
+    if name is None:
+        name = 'numba' if 'numba' in backends else 'numpy'
+    if name not in backends:
+        raise ValueError('Backend %r is not available (available : %s)' % (name, sorted(backends)))
+    return backends[name]
@@ -0,0 +1,266 @@
+#########################################################
+#
+#   Title : Barnes-Hut tree for the "cosmic ballet" application
+#   Author: Joanne Breitfelder
+#
+#   Description :
+#   This script computes the gravitational accelerations
+#   of a large number of bodies (star clusters) with the
+#   Barnes-Hut approximation : the bodies are gathered in
+#   a quadtree, and a group of bodies seen under an angle
+#   smaller than theta (size/distance < theta) acts as a
+#   single body placed at its centre of mass.
+#   The cost is O(N log N) instead of O(N^2) for the
+#   direct sum of CB_nbody.
+#
+#   The tree is rebuilt at each call. Its nodes are stored
+#   in arrays (no Python objects) : the bodies are sorted
+#   along a Morton (Z-order) curve, so that the bodies of
+#   each node are contiguous, and the tree is walked for
+#   a whole block of bodies at once, level by level.
+#
+#   Accuracy (monopole approximation, gaussian clusters of
+#   1000 to 8000 bodies, see the validate function) :
+#   - theta=0.3 : median relative error ~3e-3, 99% < 2.5e-2
+#   - theta=0.5 : median relative error ~1e-2, 99% < 7e-2
+#   Compared to the rms acceleration of the cluster, all
+#   the errors stay below 2e-3 (theta=0.5); bigger relative
+#   errors only concern bodies whose total acceleration
+#   nearly cancels (centre of the cluster).
+#   theta=0 gives the direct sum.
+#
+#########################################################
+
+import time
+import numpy as np
+import CB_nbody
+
+
+#########################################################
+### Tree construction
+#########################################################
+
+def morton(ix, iy):
+
+    ##########
+    ##  Interleaves the bits of the integer coordinates
+    ##  ix, iy (up to 31 bits) into Z-order keys
+    ##########
+
+    keys = []
+    for v in (ix, iy):
+        v = v.astype(np.int64)
+        v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+        v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+        v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+        v = (v | (v << 2)) & 0x3333333333333333
+        v = (v | (v << 1)) & 0x5555555555555555
+        keys.append(v)
+    return keys[0] | (keys[1] << 1)
+
+def build_tree(pos, m, leaf_size=8, depth=20):
+
+    ##########
+    ##  Builds the quadtree of the bodies
+    ##  pos is a (N, 2) array of positions
+    ##  m contains the N bodies masses
+    ##  leaf_size is the maximal number of bodies in a leaf
+    ##  depth is the maximal depth of the tree
+    ##  Returns a dictionnary of arrays :
+    ##    'order'       : sorting of the bodies (Morton order)
+    ##    'key'         : Morton key of each sorted body
+    ##    for each node : 'level', 'node_key', 'start', 'count'
+    ##    (range of sorted bodies), 'mass', 'com' (centre of
+    ##    mass), 'size', 'leaf', 'child' (first child), 'nchild'
+    ##########
+
+    N = pos.shape[0]
+    lo = pos.min(axis=0)
+    size = (pos.max(axis=0)-lo).max()*(1+1e-12)
+    if size==0:
+        size = 1.
+    scale = 2**depth
+    ij = np.minimum(((pos-lo)/size*scale).astype(np.int64), scale-1)
+    key = morton(ij[:, 0], ij[:, 1])
+    order = np.argsort(key, kind='mergesort')
+    key = key[order]
+    m_s = np.asarray(m, dtype=float)[order]
+    mx_s = m_s[:, None]*pos[order]
+
+    level, node_key, start, count, parent = [], [], [], [], []
+    active = np.ones(N, dtype=bool) ## Bodies in a node to be split
+    node_of = np.zeros(N, dtype=np.int64) ## Node of each body at the previous level
+    n_nodes = 0
+    for L in range(depth+1):
+        ckey = key >> 2*(depth-L)
+        bounds = np.flatnonzero(np.concatenate(([True], ckey[1:]!=ckey[:-1])))
+        counts = np.diff(np.append(bounds, N))
+        keep = active[bounds]
+        first, cnt = bounds[keep], counts[keep]
+        if first.shape[0]==0:
+            break
+        level.append(np.full(first.shape[0], L, dtype=np.int64))
+        node_key.append(ckey[first])
+        start.append(first)
+        count.append(cnt)
+        parent.append(node_of[first] if L>0 else np.array([-1]))
+
+        ## Bodies of the nodes which are not leaves go on to the next level
+        idx = np.arange(n_nodes, n_nodes+first.shape[0])
+        split = (cnt>leaf_size) & (L<depth)
+        body_node, body_pos = expand(idx, first, cnt)
+        active[:] = False
+        active[body_pos] = split[body_node-n_nodes]
+        node_of[body_pos] = body_node
+        n_nodes += first.shape[0]
+
+    tree = {'order' : order, 'key' : key, 'depth' : depth}
+    tree['level'] = np.concatenate(level)
+    tree['node_key'] = np.concatenate(node_key)
+    tree['start'] = np.concatenate(start)
+    tree['count'] = np.concatenate(count)
+    parent = np.concatenate(parent)
+
+    ## Masses and centres of mass (the bodies of a node are contiguous)
+    cm = np.concatenate(([0.], np.cumsum(m_s)))
+    cmx = np.concatenate((np.zeros((1, 2)), np.cumsum(mx_s, axis=0)))
+    end = tree['start']+tree['count']
+    tree['mass'] = cm[end]-cm[tree['start']]
+    tree['com'] = (cmx[end]-cmx[tree['start']])/tree['mass'][:, None]
+    tree['size'] = size/2.**tree['level']
+
+    ## Children of each node (contiguous, since nodes are created
+    ## level by level in Morton order : parent is sorted)
+    n_nodes = tree['level'].shape[0]
+    tree['nchild'] = np.bincount(parent[1:], minlength=n_nodes)
+    tree['child'] = np.searchsorted(parent[1:], np.arange(n_nodes))+1
+    tree['leaf'] = tree['nchild']==0
+    return tree
+
+
+#########################################################
+### Tree walk
+#########################################################
+
+def expand(owner, first, counts):
+
+    ##########
+    ##  Replaces each (owner, range) pair by the list of
+    ##  (owner, element) pairs, for all the elements of the
+    ##  range first, ..., first+counts-1
+    ##########
+
+    total = counts.sum()
+    offsets = np.arange(total)-np.repeat(np.cumsum(counts)-counts, counts)
+    return np.repeat(owner, counts), np.repeat(first, counts)+offsets
+
+def accelerations(pos, m, theta=0.5, leaf_size=8, block=4096):
+
+    ##########
+    ##  Gravitational accelerations of N bodies (Barnes-Hut)
+    ##  pos is a (N, 2) array of positions
+    ##  m contains the N bodies masses
+    ##  theta is the opening angle (0 gives the direct sum)
+    ##  leaf_size is the maximal number of bodies in a leaf
+    ##  block is the number of bodies walking the tree
+    ##  together (it bounds the memory used)
+    ##########
+
+    G=9.86e-5 ## In the right units
+
+    pos = np.asarray(pos, dtype=float)
+    N = pos.shape[0]
+    tree = build_tree(pos, m, leaf_size)
+    order, key, depth = tree['order'], tree['key'], tree['depth']
+    pos_s = pos[order]
+    m_s = np.asarray(m, dtype=float)[order]
+    com, mass, size = tree['com'], tree['mass'], tree['size']
+    level, node_key = tree['level'], tree['node_key']
+    theta2 = theta*theta
+
+    acc = np.zeros((N, 2))
+    for b in range(0, N, block):
+        body = np.arange(b, min(b+block, N))
+        nb = body.shape[0]
+        node = np.zeros(body.shape[0], dtype=np.int64) ## Root node
+        while body.shape[0]>0:
+            d = com[node]-pos_s[body]
+            r2 = d[:, 0]*d[:, 0]+d[:, 1]*d[:, 1]
+            inside = (key[body] >> 2*(depth-level[node]))==node_key[node]
+            far = (size[node]*size[node]<theta2*r2) & ~inside
+
+            ## Far nodes : the whole node acts as one body
+            f = mass[node[far]]/(r2[far]*np.sqrt(r2[far]))
+            for k in range(2):
+                acc[b:b+nb, k] += np.bincount(body[far]-b, weights=f*d[far, k], minlength=nb)
+
+            ## Close leaves : direct sum with their bodies
+            near = ~far & tree['leaf'][node]
+            i, j = expand(body[near], tree['start'][node[near]], tree['count'][node[near]])
+            keep = i!=j
+            i, j = i[keep], j[keep]
+            dd = pos_s[j]-pos_s[i]
+            rr = dd[:, 0]*dd[:, 0]+dd[:, 1]*dd[:, 1]
+            f = m_s[j]/(rr*np.sqrt(rr))
+            for k in range(2):
+                acc[b:b+nb, k] += np.bincount(i-b, weights=f*dd[:, k], minlength=nb)
+
+            ## Close nodes : their children are examined
+            opened = ~far & ~tree['leaf'][node]
+            body, node = expand(body[opened], tree['child'][node[opened]],
+                                tree['nchild'][node[opened]])
+
+    result = np.empty((N, 2))
+    result[order] = G*acc
+    return result
+
+def diff_eq(q, m, theta=0.5):
+
+    ##########
+    ##  Differential equations for the N bodies problem with
+    ##  the Barnes-Hut accelerations (same layout as CB_nbody)
+    ##  q is a position/velocity vector (length 4N)
+    ##  m contains the bodies masses
+    ##########
+
+    q = np.asarray(q, dtype=float)
+    n = q.shape[0]//2
+    qp = np.empty_like(q)
+    qp[0:n] = q[n:]
+    qp[n:] = accelerations(q[0:n].reshape(-1, 2), m, theta).ravel()
+    return qp
+
+
+#########################################################
+### Validation
+#########################################################
+
+def validate(N=2000, theta=0.5, seed=0):
+
+    ##########
+    ##  Compares the Barnes-Hut and direct (CB_nbody) accelerations
+    ##  on a random cluster (gaussian positions, random masses)
+    ##  N is the number of bodies
+    ##  theta is the opening angle
+    ##  Returns a dictionnary with the median, 99th percentile and
+    ##  maximal relative errors, the maximal error compared to the
+    ##  rms acceleration, and the two computation times
+    ##########
+
+    rng = np.random.RandomState(seed)
+    pos = rng.randn(N, 2)
+    m = rng.uniform(0.5, 1.5, N)
+
+    t = time.time()
+    acc_bh = accelerations(pos, m, theta)
+    t_bh = time.time()-t
+    t = time.time()
+    acc_direct = CB_nbody.accelerations(pos, m)
+    t_direct = time.time()-t
+
+    diff = np.hypot(*(acc_bh-acc_direct).T)
+    norm = np.hypot(*acc_direct.T)
+    err = diff/norm
+    return {'median' : np.median(err), 'p99' : np.percentile(err, 99), 'max' : err.max(),
+            'max_rms' : diff.max()/np.sqrt(np.mean(norm**2)),
+            'time_bh' : t_bh, 'time_direct' : t_direct}
@@ -0,0 +1,354 @@
+#########################################################
+#
+#   Title : Batch mode of the "cosmic ballet" application
+#   Author: Joanne Breitfelder
+#
+#   Description :
+#   This script runs many simulations without any question
+#   to the user. The scenarios are read from JSON or TOML
+#   files, solved in parallel by several processes, and for
+#   each scenario the trajectory (name.npy and name.json,
+#   see CB_storage) and the plot of the final trajectories
+#   (name.png) are written in the output directory, as well
+#   as a summary of all the simulations (summary.json).
+#   The drift of the energy and angular momentum is measured
+#   (see CB_monitor) : the simulations whose drift passes
+#   --max-drift are stopped (status 'aborted').
+#   With --events, the simulations stop when two bodies
+#   collide or when a body escapes (see CB_events) : the
+#   events are written in the summary.
+#   With --samples N, only N regularly spaced positions are
+#   written instead of every step (interpolated between the
+#   steps, see CB_core.integrate_output) : the files and the
+#   plots do not depend on the number of steps any more.
+#   With --wisdom-holman K, the equations are solved by the
+#   Wisdom-Holman method with a step K times bigger (for a
+#   third body far from the binary or very light, see
+#   CB_symplectic).
+#   With --report FILE, the final trajectories of all the
+#   scenarios are also written in one PDF file, one page per
+#   scenario (see CB_tools.report).
+#
+#   A scenario has the same fields as the initial conditions
+#   of the application : names, r, e, mass, V3x, V3y, x3, y3,
+#   tfin. Optional fields :
+#   - 'name'   : name of the files (by default, the names of
+#                the bodies, as in Cosmic_ballet.py)
+#   - 'preset' : pre-registered scenario (see CB_core.presets)
+#                giving the fields which are not written
+#
+#   A JSON file contains a list of scenarios, for example :
+#   [{"preset" : 1},
+#    {"preset" : 1, "name" : "slow-Betelgeuse", "V3x" : 1},
+#    {"names" : ["Sun", "Earth", "Comet"], "r" : 1, "e" : 0.0167,
+#     "mass" : [3.33e5, 1, 1e-12], "V3x" : 0, "V3y" : 5,
+#     "x3" : 3, "y3" : 0, "tfin" : 10}]
+#   A TOML file contains a [[scenario]] table per scenario
+#   (needs python 3.11 or the toml package).
+#
+#   How to use it :
+#   python CB_batch.py scenarios.json [other files] -o output
+#   (python CB_batch.py -h for all the options)
+#
+#########################################################
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+import CB_core
+import CB_storage
+import CB_backend
+import CB_monitor
+import CB_events
+import CB_symplectic
+
+try:
+    import tomllib as toml
+except ImportError:
+    try:
+        import toml
+    except ImportError:
+        toml = None
+
+## Fields of a scenario
+fields = ['names', 'r', 'e', 'mass', 'V3x', 'V3y', 'x3', 'y3', 'tfin']
+
+
+#########################################################
+### Scenarios
+#########################################################
+
+def load_scenarios(filename):
+
+    ##########
+    ##  Reads the scenarios of a JSON or TOML file
+    ##  Returns a list of dictionnaries (one per scenario)
+    ##########
+
+    if os.path.splitext(filename)[1].lower()=='.toml':
+        if toml is None:
+            raise ImportError('Reading %s needs python 3.11 or the toml package' % filename)
+        with open(filename, 'rb' if toml.__name__=='tomllib' else 'r') as f:
+            data = toml.load(f)
+    else:
+        with open(filename) as f:
+            data = json.load(f)
+
+    if isinstance(data, dict):
+        data = data.get('scenario', data.get('scenarios', [data]))
+    return list(data)
+
+def scenario_parameters(scenario):
+
+    ##########
+    ##  Dictionnary of parameters of a scenario
+    ##  (see CB_core.parameters)
+    ##########
+
+    values = dict(CB_core.presets[int(scenario['preset'])]) if 'preset' in scenario else {}
+    values.update(scenario)
+    missing = [field for field in fields if field not in values]
+    if missing:
+        raise ValueError('Missing fields in scenario %r : %s' % (scenario.get('name', scenario), missing))
+    return CB_core.parameters([str(name) for name in values['names']], values['r'], values['e'],
+                               list(values['mass']), values['V3x'], values['V3y'],
+                               values['x3'], values['y3'], float(values['tfin']))
+
+def job_list(filenames, output):
+
+    ##########
+    ##  Jobs of the batch
+    ##  filenames are the scenario files
+    ##  output is the output directory
+    ##  Returns a list of (name, scenario, output) ; the names
+    ##  are made unique
+    ##########
+
+    jobs, count = [], {}
+    for filename in filenames:
+        for scenario in load_scenarios(filename):
+            if 'name' in scenario:
+                name = str(scenario['name'])
+            elif 'names' in scenario:
+                name = '-'.join(str(n) for n in scenario['names'])
+            else:
+                name = '-'.join(CB_core.presets[int(scenario['preset'])]['names'])
+            count[name] = count.get(name, 0)+1
+            if count[name]>1:
+                name = name+'-'+str(count[name])
+            jobs.append((name, scenario, output))
+    return jobs
+
+
+#########################################################
+### Running the jobs
+#########################################################
+
+def run_job(job, backend=None, plot=True, max_drift=None, events=False, samples=None, wisdom_holman=None):
+
+    ##########
+    ##  Solves a scenario and writes its files
+    ##  job is given by job_list
+    ##  backend is the integration backend (see CB_backend)
+    ##  plot allows to save the final trajectories
+    ##  max_drift is the maximal drift of the conserved
+    ##  quantities (None : no limit)
+    ##  events allows to stop at collisions and escapes
+    ##  samples is the number of positions written (None : all
+    ##  the steps)
+    ##  wisdom_holman is the step factor of the Wisdom-Holman
+    ##  method (see CB_symplectic ; None : Runge-Kutta method)
+    ##  Returns the summary of the job (a dictionnary) ; the
+    ##  errors are written in the summary, they do not stop
+    ##  the batch
+    ##########
+
+    name, scenario, output = job
+    summary = {'name' : name, 'status' : 'ok'}
+    start = time.time()
+    try:
+        params = scenario_parameters(scenario)
+        dt, number = CB_core.step(params['r'], params['tfin'])
+        if wisdom_holman is not None:
+            dt, number = dt*wisdom_holman, int(number/wisdom_holman)
+            method = CB_symplectic.integrate_wisdom_holman
+        else:
+            method = CB_backend.get_backend(backend)
+        summary['dt'], summary['planned_steps'] = dt, number
+
+        monitor = CB_monitor.ConservationMonitor(params['mass'], threshold=max_drift)
+        integrate = monitor.wrap(method)
+        if events:
+            detector = CB_events.EventDetector(CB_events.default_events(params))
+            integrate = detector.wrap(integrate)
+        try:
+            if samples is None:
+                trajectory = CB_storage.integrate_to_file(os.path.join(output, name+'.npy'),
+                                                          CB_core.initial_vector(params), params, dt, number,
+                                                          integrate=integrate)[0]
+            else:
+                ## The file has the same layout, with the output step as dt
+                trajectory = CB_core.integrate_output(CB_core.initial_vector(params), params['mass'], dt, number,
+                                                      CB_core.output_grid(dt, number, samples), integrate)[1]
+                with CB_storage.TrajectoryWriter(os.path.join(output, name+'.npy'), params, number*dt/samples,
+                                                 samples) as writer:
+                    writer.write(trajectory)
+        finally:
+            ## Steps integrated (less than planned after an event or
+            ## an abort, and not the number of positions written
+            ## with samples)
+            summary['steps'] = detector.step if events else monitor.step
+            summary['drift'] = monitor.max_drift()
+        if events:
+            summary['events'] = [{'name' : record['name'], 'time' : record['time']} for record in detector.records]
+            if detector.terminated is not None:
+                summary['stopped'] = detector.terminated['name']
+        summary['integration_time'] = time.time()-start
+
+        if plot:
+            import matplotlib
+            matplotlib.use('Agg') ## No window
+            import matplotlib.pyplot as plt
+            import CB_tools
+            plotted = params
+            if events and detector.terminated is not None:
+                plotted = dict(params, tfin=summary['steps']*dt) ## Duration in the title
+            CB_tools.final_trajectories(trajectory[:, 0:6].T, plotted, save_files=True,
+                                        directory=output, filename=name+'.png')
+            plt.close('all')
+    except CB_monitor.DriftError as error:
+        summary['status'], summary['error'] = 'aborted', str(error)
+    except Exception as error:
+        summary['status'], summary['error'] = 'error', '%s : %s' % (type(error).__name__, error)
+    summary['runtime'] = time.time()-start
+    return summary
+
+def run_job_star(args):
+    return run_job(*args)
+
+def run_batch(filenames, output='batch_output', processes=None, backend=None, plot=True,
+              max_drift=None, events=False, samples=None, wisdom_holman=None):
+
+    ##########
+    ##  Runs all the scenarios of the files
+    ##  filenames are the scenario files
+    ##  output is the output directory
+    ##  processes is the number of processes (by default, the
+    ##  number of cores)
+    ##  backend is the integration backend (see CB_backend)
+    ##  plot allows to save the final trajectories
+    ##  max_drift is the maximal drift of the conserved
+    ##  quantities (None : no limit)
+    ##  events allows to stop at collisions and escapes
+    ##  samples is the number of positions written (None : all
+    ##  the steps)
+    ##  wisdom_holman is the step factor of the Wisdom-Holman
+    ##  method (see CB_symplectic ; None : Runge-Kutta method)
+    ##  Returns the list of summaries (see run_job), also
+    ##  written in output/summary.json
+    ##########
+
+    if not os.path.exists(output):
+        os.makedirs(output)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    jobs = job_list(filenames, output)
+    tasks = [(job, backend, plot, max_drift, events, samples, wisdom_holman) for job in jobs]
+    start = time.time()
+    if processes>1 and len(jobs)>1:
+        pool = multiprocessing.Pool(min(processes, len(jobs)))
+        try:
+            summaries = []
+            for summary in pool.imap_unordered(run_job_star, tasks):
+                summaries.append(summary)
+                print_summary(summary, len(summaries), len(jobs))
+        finally:
+            pool.terminate()
+    else:
+        summaries = []
+        for task in tasks:
+            summaries.append(run_job_star(task))
+            print_summary(summaries[-1], len(summaries), len(jobs))
+
+    ## Same order as in the files
+    order = dict((job[0], k) for k, job in enumerate(jobs))
+    summaries.sort(key=lambda summary: order[summary['name']])
+    with open(os.path.join(output, 'summary.json'), 'w') as f:
+        json.dump({'jobs' : summaries, 'processes' : processes,
+                   'total_time' : time.time()-start}, f, indent=1)
+    return summaries
+
+def report_pages(summaries, output):
+
+    ##########
+    ##  Gives the (q, params) of each successful job, one at a
+    ##  time (see CB_tools.report)
+    ##  summaries are given by run_batch
+    ##  output is the output directory
+    ##########
+
+    for summary in summaries:
+        if summary['status']!='ok':
+            continue
+        trajectory, meta = CB_storage.open_trajectory(os.path.join(output, summary['name']+'.npy'))
+        params = meta['params']
+        params['tfin'] = meta['number']*meta['dt'] ## Shorter if the simulation was stopped
+        yield trajectory[:, 0:6].T, params
+
+def write_report(summaries, output, filename):
+
+    ##########
+    ##  Writes the final trajectories of all the successful
+    ##  jobs in one PDF file (see CB_tools.report)
+    ##  Returns the number of pages
+    ##########
+
+    import matplotlib
+    matplotlib.use('Agg') ## No window
+    import CB_tools
+    return CB_tools.report(report_pages(summaries, output), filename)
+
+def print_summary(summary, k, total):
+
+    ##########
+    ##  Prints the summary of a job
+    ##  k is the number of finished jobs, total the number of jobs
+    ##########
+
+    if summary['status']=='ok':
+        print('[%d/%d] %-30s %10d steps %8.1f s   drift %.1e%s' % (k, total, summary['name'], summary['steps'],
+                                                                summary['runtime'], summary['drift'],
+                                                                '   stopped : '+summary['stopped'] if 'stopped' in summary else ''))
+    elif 'steps' in summary:
+        print('[%d/%d] %-30s %10d steps %s : %s' % (k, total, summary['name'], summary['steps'],
+                                                   summary['status'], summary['error']))
+    else:
+        print('[%d/%d] %-30s %s : %s' % (k, total, summary['name'], summary['status'], summary['error']))
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Runs the scenarios of JSON/TOML files without any question.')
+    parser.add_argument('files', nargs='+', help='scenario files')
+    parser.add_argument('-o', '--output', default='batch_output', help='output directory')
+    parser.add_argument('-j', '--processes', type=int, default=None, help='number of processes (default : number of cores)')
+    parser.add_argument('--backend', default=None, choices=sorted(CB_backend.backends), help='integration backend (default : fastest)')
+    parser.add_argument('--no-plot', action='store_true', help='do not save the plots')
+    parser.add_argument('--max-drift', type=float, default=None, help='stop the simulations whose energy or angular momentum drift passes this value')
+    parser.add_argument('--events', action='store_true', help='stop the simulations at collisions and escapes')
+    parser.add_argument('--samples', type=int, default=None, help='number of positions written (default : every step)')
+    parser.add_argument('--wisdom-holman', type=float, default=None, metavar='K', help='Wisdom-Holman method with a step K times bigger (hierarchical systems)')
+    parser.add_argument('--report', default=None, metavar='FILE', help='PDF file with the final trajectories of all the scenarios, one per page')
+    args = parser.parse_args()
+
+    summaries = run_batch(args.files, args.output, args.processes, args.backend, not args.no_plot, args.max_drift,
+                          args.events, args.samples, args.wisdom_holman)
+    if args.report is not None:
+        pages = write_report(summaries, args.output, args.report)
+        print('%d pages written in %s' % (pages, args.report))
+    failed = len([summary for summary in summaries if summary['status']!='ok'])
+    print('%d scenarios, %d failed, summary in %s' % (len(summaries), failed, os.path.join(args.output, 'summary.json')))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,295 @@
+#########################################################
+#
+#   Title : Benchmarks for the "cosmic ballet" application
+#   Author: Joanne Breitfelder
+#
+#   Description :
+#   This script measures the speed of the application
+#   on the pre-registered scenarios (see CB_core.presets),
+#   and the time needed to import its modules.
+#
+#   The benchmark suite runs each pre-registered scenario,
+#   and the same scenario 10 times longer, in a new python
+#   process (so that the memory used by each one is
+#   measured alone) and gives :
+#   - the integration speed of each backend (steps/second)
+#     and whether they give the same trajectory
+#   - the maximal memory used (RSS) after the integration
+#     and after the plots
+#   - the time to draw the first image of the animation and
+#     to save the plot of the final trajectories
+#   - the error of the simulation : drift of the energy, and
+#     distance to a reference trajectory (same method with
+#     a step 8 times smaller : its error is about 4000 times
+#     smaller, except after very close encounters where the
+#     trajectories are chaotic)
+#   The time needed to import the modules is also measured,
+#   with the modules which import matplotlib (slow start).
+#   The results are written in a JSON file, with the version
+#   of the code (git commit) : two files can be compared.
+#
+#   How to use it :
+#   - Run CB_bench.py, the results are printed and written
+#     in bench_results.json (-o to choose the file, --quick
+#     for the short scenarios only)
+#   - python CB_bench.py --compare old.json new.json
+#
+#########################################################
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+import CB_core
+import CB_backend
+
+try:
+    import resource
+except ImportError: ## Windows
+    resource = None
+
+
+#########################################################
+### Benchmarks
+#########################################################
+
+def backend_benchmark(params, repeat=3):
+
+    ##########
+    ##  Integration speed of each backend (steps/second)
+    ##  params contains a dictionnary of parameters
+    ##  repeat is the number of runs (the best one is kept)
+    ##  Returns a dictionnary {backend : (steps/second, same
+    ##  trajectory as the numpy backend)} and the trajectory
+    ##  of the numpy backend
+    ##########
+
+    q = CB_core.initial_vector(params)
+    dt, number = CB_core.step(params['r'], params['tfin'])
+
+    results = {}
+    reference = None
+    for name in sorted(CB_backend.backends, key=lambda n: n!='numpy'):
+        integrate = CB_backend.get_backend(name)
+        integrate(q, params['mass'], dt, 10) ## Warm-up (compilation)
+        best = np.inf
+        for i in range(repeat):
+            t = time.time()
+            q_all = integrate(q, params['mass'], dt, number)
+            best = min(best, time.time()-t)
+        if reference is None:
+            reference = q_all
+        results[name] = (number/best, bool(np.array_equal(q_all, reference)))
+    return results, reference
+
+def startup_benchmark(modules=('CB_core', 'CB_tools', 'CB_batch'), repeat=5):
+
+    ##########
+    ##  Time needed to start python and import a module
+    ##  (each import is done by a new python process)
+    ##  modules are the modules to import
+    ##  repeat is the number of runs (the best one is kept)
+    ##  Returns a dictionnary {module : (seconds, matplotlib
+    ##  imported)} ; the module None is python alone
+    ##########
+
+    directory = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for module in (None,)+tuple(modules):
+        code = 'import sys\n'
+        if module is not None:
+            code += 'import '+module+'\n'
+        code += 'sys.stdout.write(str("matplotlib" in sys.modules))'
+        best = np.inf
+        for i in range(repeat):
+            t = time.time()
+            output = subprocess.check_output([sys.executable, '-c', code], cwd=directory)
+            best = min(best, time.time()-t)
+        results[module] = (best, output.strip()==b'True')
+    return results
+
+
+def peak_memory():
+
+    ##########
+    ##  Maximal memory used by the process until now (RSS, in MB)
+    ##  (None if it can not be measured)
+    ##########
+
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss/2.**20 if sys.platform=='darwin' else rss/2.**10 ## bytes on Mac OS, kB elsewhere
+
+
+#########################################################
+### Benchmark suite
+#########################################################
+
+def case_benchmark(k, scale=1, repeat=3):
+
+    ##########
+    ##  Benchmark of a scenario (see the description above)
+    ##  k is the pre-registered scenario
+    ##  scale multiplies its duration
+    ##  repeat is the number of runs (the best one is kept)
+    ##  Returns a dictionnary of results
+    ##########
+
+    params = CB_core.preset_parameters(k)
+    params['tfin'] = params['tfin']*scale
+    q = CB_core.initial_vector(params)
+    m = params['mass']
+    dt, number = CB_core.step(params['r'], params['tfin'])
+    results = {'name' : '-'.join(params['names'])+('' if scale==1 else ' x'+str(scale)),
+               'preset' : k, 'scale' : scale, 'steps' : number, 'dt' : dt,
+               'memory_start' : peak_memory()}
+
+    ## Integration speed
+    speeds, q_all = backend_benchmark(params, repeat)
+    results['steps_per_second'] = dict((name, speed) for name, (speed, same) in speeds.items())
+    results['same_trajectory'] = all(same for speed, same in speeds.values())
+    results['memory_integration'] = peak_memory()
+
+    ## Accuracy (the reference is calculated chunk by chunk : only
+    ## its last step is kept, the memory used stays small)
+    integrate = CB_backend.get_backend()
+    fine, done = np.array(q, dtype=float), 0
+    while done<8*number:
+        steps = min(100000, 8*number-done)
+        fine = integrate(fine, m, dt/8, steps)[-1]
+        done += steps
+    E0, E = CB_core.energy(q, m), CB_core.energy(q_all[-1], m)
+    size = np.max(np.abs(q_all[:, 0:6]))
+    results['energy_error'] = abs(E-E0)/abs(E0)
+    results['position_error'] = np.max(np.abs(q_all[-1, 0:6]-fine[0:6]))/size
+
+    ## Plots (without window)
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import CB_tools
+
+    t = time.time()
+    fig = plt.figure(0, figsize=(12, 6))
+    artists = CB_tools.animation_figure(fig, q_all[:, 0:6].T, params, animated=True)
+    fig.canvas.draw()
+    CB_tools.animation_frame(q_all[:, 0:6].T, params, dt, CB_tools.frame_schedule(number)[1], artists)
+    for artist in artists:
+        fig.axes[0].draw_artist(artist)
+    results['first_frame_time'] = time.time()-t
+    plt.close('all')
+
+    directory = tempfile.mkdtemp()
+    t = time.time()
+    CB_tools.final_trajectories(q_all[:, 0:6].T, params, save_files=True, directory=directory, filename='bench.png')
+    results['final_plot_time'] = time.time()-t
+    plt.close('all')
+    os.remove(os.path.join(directory, 'bench.png'))
+    os.rmdir(directory)
+    results['memory_total'] = peak_memory()
+    return results
+
+def version():
+
+    ##########
+    ##  Description of the code and of the machine
+    ##########
+
+    directory = os.path.dirname(os.path.abspath(__file__))
+    info = {'python' : platform.python_version(), 'numpy' : np.__version__,
+            'numba' : CB_backend.numba.__version__ if CB_backend.numba is not None else None,
+            'machine' : platform.platform(), 'date' : time.strftime('%Y-%m-%d %H:%M:%S')}
+    try:
+        info['commit'] = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=directory).decode().strip()
+        info['modified'] = len(subprocess.check_output(['git', 'status', '--porcelain', '-uno'], cwd=directory).strip())>0
+    except (OSError, subprocess.CalledProcessError):
+        info['commit'] = None
+    return info
+
+def suite(scales=(1, 10), repeat=3):
+
+    ##########
+    ##  Runs the benchmark suite (each scenario in a new process)
+    ##  scales are the durations of the scenarios (1 : as
+    ##  pre-registered)
+    ##  repeat is the number of runs of each integration
+    ##  Returns a dictionnary : 'version', 'startup' ({module :
+    ##  {'seconds', 'matplotlib'}}, see startup_benchmark) and
+    ##  'cases' (see case_benchmark)
+    ##########
+
+    cases = []
+    for scale in scales:
+        for k in sorted(CB_core.presets):
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--case',
+                                              str(k), str(scale), str(repeat)])
+            cases.append(json.loads(output.decode().strip().split('\n')[-1]))
+            print_case(cases[-1])
+    startup = dict((module or 'python', {'seconds' : seconds, 'matplotlib' : plotting})
+                   for module, (seconds, plotting) in startup_benchmark().items())
+    print_startup(startup)
+    return {'version' : version(), 'startup' : startup, 'cases' : cases}
+
+def print_case(case):
+    speed = ', '.join('%s %.0f' % item for item in sorted(case['steps_per_second'].items()))
+    print('%-32s %8d steps | steps/s : %s | energy error %.1e | position error %.1e | '
+          'first image %.2f s | final plot %.2f s | memory %s MB'
+          % (case['name'], case['steps'], speed, case['energy_error'], case['position_error'],
+             case['first_frame_time'], case['final_plot_time'],
+             '%.0f' % case['memory_total'] if case['memory_total'] is not None else '?'))
+
+def print_startup(startup):
+    for module in sorted(startup):
+        print('%-32s %6.2f s%s' % (module if module=='python' else 'import '+module, startup[module]['seconds'],
+                                   ' (imports matplotlib)' if startup[module]['matplotlib'] else ''))
+
+def compare(old, new):
+
+    ##########
+    ##  Prints the changes between two result files
+    ##  old, new are the JSON files written by the suite
+    ##########
+
+    with open(old) as f:
+        old = json.load(f)
+    with open(new) as f:
+        new = json.load(f)
+    print('%s -> %s' % (old['version'].get('commit'), new['version'].get('commit')))
+    old_cases = dict((case['name'], case) for case in old['cases'])
+    for case in new['cases']:
+        if case['name'] not in old_cases:
+            continue
+        before = old_cases[case['name']]
+        changes = []
+        for name in sorted(case['steps_per_second']):
+            if name in before['steps_per_second']:
+                changes.append('%s %+.0f%%' % (name, 100*(case['steps_per_second'][name]/before['steps_per_second'][name]-1)))
+        for key in ['first_frame_time', 'final_plot_time', 'memory_total', 'energy_error']:
+            if before.get(key) and case.get(key) is not None:
+                changes.append('%s %+.0f%%' % (key, 100*(case[key]/before[key]-1)))
+        print('%-32s %s' % (case['name'], ' | '.join(changes)))
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the cosmic ballet application.')
+    parser.add_argument('-o', '--output', default='bench_results.json', help='result file')
+    parser.add_argument('--quick', action='store_true', help='pre-registered scenarios only, one run each')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files')
+    parser.add_argument('--case', nargs=3, type=int, metavar=('PRESET', 'SCALE', 'REPEAT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case is not None:
+        print(json.dumps(case_benchmark(*args.case)))
+    elif args.compare is not None:
+        compare(*args.compare)
+    else:
+        results = suite((1,), 1) if args.quick else suite()
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        print('Results written in '+args.output)
@@ -0,0 +1,215 @@
+#########################################################
+#
+#   Title : Trajectory cache for the "cosmic ballet" application
+#   Author: Joanne Breitfelder
+#
+#   Description :
+#   This script keeps the calculated trajectories on the
+#   disk, so that a simulation which was already done
+#   (same scenario, to change the display, or a pre-registered
+#   scenario run again) is read instead of being calculated.
+#
+#   A trajectory is found by a hash of what determines it :
+#   the masses, r, e, the initial position and velocity of
+#   the third body, the integration method and dt (the
+#   names of the bodies do not count). It is stored compressed
+#   (key.npz). When the cache is bigger than its maximal size,
+#   the trajectories which were not used for the longest time
+#   are removed.
+#
+#   tfin is not part of the hash : dt does not depend on it,
+#   so a shorter simulation is the beginning of the stored
+#   trajectory, and a longer one is calculated from its last
+#   step (only the extra steps are calculated). The result is
+#   exactly the one of a new simulation.
+#
+#   The checks done during the integration (events and
+#   conservation monitor, see CB_storage.wrapped_integrate)
+#   are part of the hash, and their results are stored with
+#   the trajectory : a trajectory read from the cache gives
+#   the same warnings as a new one, and a trajectory stopped
+#   by a collision is not extended.
+#
+#   Usage :
+#   cache = CB_cache.TrajectoryCache()
+#   q_all, checks = cache.integrate(q, params, dt, number, options=options)
+#   cache.stats  ## {'hits' : ..., 'extensions' : ..., 'misses' : ..., 'evictions' : ...}
+#
+#########################################################
+
+import os
+import json
+import hashlib
+import numpy as np
+import CB_core
+import CB_storage
+
+## Default place of the cache
+default_directory = os.path.join(os.path.expanduser('~'), '.cosmic_ballet', 'cache')
+
+
+#########################################################
+### Keys
+#########################################################
+
+def cache_key(params, dt, method='rk4', options=None):
+
+    ##########
+    ##  Hash of what determines a trajectory (except its length)
+    ##  params contains a dictionnary of parameters
+    ##  dt is the step
+    ##  method is the integration method (the numpy and numba
+    ##  backends of CB_backend give the same trajectory : both
+    ##  are 'rk4')
+    ##  options are the checks done during the integration
+    ##  (see CB_storage.wrapped_integrate)
+    ##########
+
+    inputs = {'mass' : [float(m) for m in params['mass']], 'method' : method, 'dt' : float(dt),
+              'options' : options}
+    for name in ['r', 'e', 'x3', 'y3', 'V3x', 'V3y']:
+        inputs[name] = float(params[name])
+    return hashlib.sha1(json.dumps(inputs, sort_keys=True).encode('ascii')).hexdigest()
+
+
+#########################################################
+### Cache
+#########################################################
+
+class TrajectoryCache(object):
+
+    ##########
+    ##  Compressed trajectories stored on the disk
+    ##  directory is the place of the cache
+    ##  max_size is the maximal size of the cache (in bytes)
+    ##  stats counts the hits (trajectory found), the extensions
+    ##  (trajectory found, but too short), the misses (trajectory
+    ##  calculated) and the evictions (trajectory removed to
+    ##  make room)
+    ##########
+
+    def __init__(self, directory=default_directory, max_size=2**29):
+        self.directory, self.max_size = directory, max_size
+        self.stats = {'hits' : 0, 'extensions' : 0, 'misses' : 0, 'evictions' : 0}
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def filename(self, key):
+        return os.path.join(self.directory, key+'.npz')
+
+    def get(self, key):
+
+        ##########
+        ##  Returns the trajectory of the key and the results of
+        ##  its checks (see CB_storage.check_results), or None,
+        ##  None if it is not in the cache
+        ##########
+
+        filename = self.filename(key)
+        try:
+            with np.load(filename) as data:
+                q_all = data['q_all']
+                checks = json.loads(str(data['checks'])) if 'checks' in data.files else None
+        except (IOError, OSError, KeyError, ValueError):
+            return None, None
+        os.utime(filename, None) ## Last use
+        return q_all, CB_storage.checks_until(checks, q_all.shape[0])
+
+    def put(self, key, q_all, checks=None):
+
+        ##########
+        ##  Stores the trajectory of the key and the results of
+        ##  its checks, then removes the oldest ones if the cache
+        ##  is too big
+        ##########
+
+        filename = self.filename(key)
+        temporary = filename+'.tmp'
+        with open(temporary, 'wb') as f:
+            np.savez_compressed(f, q_all=q_all, checks=np.array(json.dumps(checks)))
+        CB_storage.replace_file(temporary, filename)
+        self.evict()
+
+    def entries(self):
+
+        ##########
+        ##  Returns the list of (last use, size, file) of the
+        ##  trajectories, from the oldest to the most recent
+        ##########
+
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                filename = os.path.join(self.directory, name)
+                entries.append((os.path.getmtime(filename), os.path.getsize(filename), filename))
+        return sorted(entries)
+
+    def evict(self):
+
+        ##########
+        ##  Removes the trajectories which were not used for the
+        ##  longest time, until the cache is small enough
+        ##########
+
+        entries = self.entries()
+        size = sum(entry[1] for entry in entries)
+        for last_use, entry_size, filename in entries:
+            if size<=self.max_size:
+                break
+            os.remove(filename)
+            size -= entry_size
+            self.stats['evictions'] += 1
+
+    def size(self):
+        return sum(entry[1] for entry in self.entries())
+
+    def clear(self):
+        for entry in self.entries():
+            os.remove(entry[2])
+
+    def integrate(self, q, params, dt, number, integrate=CB_core.integrate, method='rk4', options=None,
+                  reused=None, wrap=None):
+
+        ##########
+        ##  Same as integrate(q, params['mass'], dt, number) with
+        ##  the checks of options (see CB_storage.wrapped_integrate),
+        ##  the trajectory being read from the cache if possible
+        ##  q is the initial position/velocity vector
+        ##  params contains a dictionnary of parameters
+        ##  dt and number are given by the step function
+        ##  integrate is the integration function, without checks
+        ##  (see CB_backend)
+        ##  method is the name of its integration method
+        ##  reused is a function called with the steps read from
+        ##  the cache before the extra steps are calculated, wrap
+        ##  a function applied to the integration function with
+        ##  the checks (see CB_live.Producer.tee ; None : not used)
+        ##  Returns the trajectory (shorter if it was stopped by
+        ##  an event) and the results of the checks (see
+        ##  CB_storage.check_results)
+        ##########
+
+        key = cache_key(params, dt, method, options)
+        q_all, checks = self.get(key)
+        if q_all is not None and (q_all.shape[0]>=number or checks['terminated'] is not None):
+            self.stats['hits'] += 1
+            if reused is not None:
+                reused(q_all[0:number])
+            return q_all[0:number], CB_storage.checks_until(checks, number)
+
+        count = 0 if q_all is None else q_all.shape[0]
+        integrate, monitor, detector = CB_storage.wrapped_integrate(params, options, count, integrate)
+        if wrap is not None:
+            integrate = wrap(integrate)
+        if q_all is None:
+            self.stats['misses'] += 1
+            q_all = integrate(q, params['mass'], dt, number)
+        else:
+            self.stats['extensions'] += 1
+            if reused is not None:
+                reused(q_all)
+            q_all = np.concatenate((q_all, integrate(q_all[-1], params['mass'], dt, number-count)))
+        checks = CB_storage.check_results(monitor, detector, checks)
+        if q_all.shape[0]>0:
+            self.put(key, q_all, checks)
+        return q_all, checks
@@ -0,0 +1,345 @@
+#########################################################
+#
+#   Title : Core of the "cosmic ballet" application
+#   Author: Joanne Breitfelder
+#
+#   Description :
+#   This script gathers the functions needed to solve
+#   the 3 bodies problem (initial conditions, equations,
+#   Runge-Kutta method, step). Its only dependency is
+#   numpy : the scripts which do not plot anything import
+#   this module instead of CB_tools, and do not pay for
+#   the import of matplotlib.
+#
+#   CB_tools gives access to the same functions.
+#
+#########################################################
+
+import numpy as np
+
+
+#########################################################
+### Pre-registered scenarios
+#########################################################
+
+## Distances are in UA, time in year, masses in Earth masses
+presets = {
+    ## Betelgeuse visiting the Jupiter-Sun system
+    1 : {'names' : ['Sun', 'Jupiter', 'Betelgeuse'],
+         'r' : 5.202,
+         'e' : 0,
+         'mass' : [3.33e5, 3.1e2, 2.5e6],
+         'V3x' : 2, 'V3y' : 0,
+         'x3' : -6e1, 'y3' : 3e1,
+         'tfin' : 80.},
+    ## Earth-like planet evolving in a binary system
+    2 : {'names' : ['Star1', 'Star2', 'Planet'],
+         'r' : 10.5,
+         'e' : 0.5,
+         'mass' : [4e5, 4e5, 1],
+         'V3x' : 0, 'V3y' : -8.7,
+         'x3' : 4, 'y3' : 0,
+         'tfin' : 80.},
+    ## Comet 67P entering the Earth-Moon system!
+    3 : {'names' : ['Earth', 'Moon', 'Comet 67P'],
+         'r' : 0.00257,
+         'e' : 0.0549,
+         'mass' : [1, 0.0123, 1.67e-12],
+         'V3x' : 0.02, 'V3y' : 0.005,
+         'x3' : -0.08, 'y3' : 0,
+         'tfin' : 15.0}}
+
+def parameters(names, r, e, m, V3x, V3y, x3, y3, tfin):
+    
+    ##########
+    ##  Dictionnary of parameters of a simulation
+    ##  The two first bodies orbit around each other, the first
+    ##  one being at (0, 0) and the second one on the x-axis
+    ##########
+    
+    G=9.86e-5 ## In the right units
+    
+    return {'names' : names,
+        'r' : r,
+        'e' : e,
+        'mass' : m,
+        'V3x' : V3x,
+        'V3y' : V3y,
+        'x3' : x3,
+        'y3' : y3,
+        'tfin' : tfin,
+        'x1' : 0,
+        'y1' : 0,
+        'y2' : 0,
+        'V1x' : 0,
+        'V2x' : 0,
+        'V1y' : np.sqrt((1+e)*G*(m[1]**2/(m[0]+m[1]))/(r*(1-e))),
+        'V2y' : -np.sqrt((1+e)*G*(m[0]**2/(m[0]+m[1]))/(r*(1-e))),
+        'x2' : r*(1-e)}
+
+def preset_parameters(k):
+    
+    ##########
+    ##  Dictionnary of parameters of the pre-registered scenario k
+    ##########
+    
+    p = presets[k]
+    return parameters(list(p['names']), p['r'], p['e'], list(p['mass']),
+                      p['V3x'], p['V3y'], p['x3'], p['y3'], p['tfin'])
+
+def initial_vector(params):
+    
+    ##########
+    ##  Initial position/velocity vector from the
+    ##  dictionnary of parameters
+    ##########
+    
+    return [params['x1'], params['y1'], params['x2'], params['y2'],
+            params['x3'], params['y3'], params['V1x'], params['V1y'],
+            params['V2x'], params['V2y'], params['V3x'], params['V3y']]
+
+
+#########################################################
+### Equation resolution
+#########################################################
+
+def diff_eq(q, m):
+    
+    ##########
+    ##  Differential equations for the 3 bodies problem
+    ##  q is a position/velocity vector
+    ##  m contains the bodies masses
+    ##  The positions are read as plain floats (cheaper than numpy
+    ##  scalars for 12 elements) and the derivative is written
+    ##  into a preallocated array
+    ##########
+    
+    c=3./2.
+    G=9.86e-5 ## In the right units
+    
+    q = np.asarray(q, dtype=float)
+    x1, y1, x2, y2, x3, y3 = q[0:6].tolist()
+    
+    m1m2=((x2-x1)*(x2-x1)+(y2-y1)*(y2-y1))**c
+    m1m3=((x3-x1)*(x3-x1)+(y3-y1)*(y3-y1))**c
+    m2m3=((x3-x2)*(x3-x2)+(y3-y2)*(y3-y2))**c
+
+    qp = np.empty(12)
+    qp[0:6] = q[6:12]
+    
+    qp[6] = G*(m[1]*(x2-x1)/m1m2+m[2]*(x3-x1)/m1m3)
+    qp[7] = G*(m[1]*(y2-y1)/m1m2+m[2]*(y3-y1)/m1m3)
+    
+    qp[8] = G*(m[0]*(x1-x2)/m1m2+m[2]*(x3-x2)/m2m3)
+    qp[9] = G*(m[0]*(y1-y2)/m1m2+m[2]*(y3-y2)/m2m3)
+    
+    qp[10] = G*(m[0]*(x1-x3)/m1m3+m[1]*(x2-x3)/m2m3)
+    qp[11] = G*(m[0]*(y1-y3)/m1m3+m[1]*(y2-y3)/m2m3)
+
+    return qp
+
+def rKN(x, m, fx, n, dt):
+    
+    ##########
+    ##  Runge-Kutta method in dimension n
+    ##  x is a position/velocity vector
+    ##  m contains the bodies masses
+    ##  fx is the differential function to solve
+    ##  dt is the step for the successive iterations 
+    ##  Each stage calls fx only once, on the whole vector
+    ##########
+    
+    x = np.asarray(x[0:n], dtype=float)
+    k1 = fx(x, m)*dt
+    k2 = fx(x+k1*0.5, m)*dt
+    k3 = fx(x+k2*0.5, m)*dt
+    k4 = fx(x+k3, m)*dt
+    return x+(k1+2*(k2+k3)+k4)/6
+
+def integrate(q, m, dt, number, fx=diff_eq):
+    
+    ##########
+    ##  Solves the equations over a given number of steps
+    ##  q is the initial position/velocity vector
+    ##  m contains the bodies masses
+    ##  dt and number are given by the step function
+    ##  fx is the differential function to solve
+    ##  Returns a (number, len(q)) array, one line per step
+    ##########
+    
+    q = np.array(q, dtype=float)
+    n = q.shape[0]
+    q_all = np.empty((number, n))
+    for i in range(number):
+        q = rKN(q, m, fx, n, dt)
+        q_all[i] = q
+    return q_all
+
+def hermite(y0, f0, y1, f1, dt, theta):
+
+    ##########
+    ##  Cubic Hermite interpolation inside steps
+    ##  y0, y1 are the vectors at the beginning and at the end
+    ##  of the steps (one per line), f0, f1 their derivatives
+    ##  theta is an array of fractions of the steps (between 0
+    ##  and 1)
+    ##########
+
+    theta = np.asarray(theta, dtype=float)[:, np.newaxis]
+    theta2, theta3 = theta**2, theta**3
+    return ((2*theta3-3*theta2+1)*y0+(theta3-2*theta2+theta)*dt*f0
+            +(3*theta2-2*theta3)*y1+(theta3-theta2)*dt*f1)
+
+def output_grid(dt, number, samples):
+
+    ##########
+    ##  Regular grid of samples times over the simulation
+    ##  dt and number are given by the step function
+    ##  The line i of the result of integrate_output is then
+    ##  at the time (i+1)*tfin/samples, as the line i of the
+    ##  result of integrate is at the time (i+1)*dt
+    ##########
+
+    return np.linspace(0, number*dt, samples+1)[1:]
+
+def integrate_output(q, m, dt, number, t_out, integrate=integrate, fx=diff_eq, chunk=100000):
+
+    ##########
+    ##  Solves the equations over a given number of steps, but
+    ##  gives the solution on the time grid t_out only : the
+    ##  memory used depends on the number of outputs, not on the
+    ##  number of steps
+    ##  q is the initial position/velocity vector
+    ##  m contains the bodies masses
+    ##  dt and number are given by the step function
+    ##  t_out is the time grid (increasing, in [0, number*dt],
+    ##  see output_grid)
+    ##  integrate is the integration function (see CB_backend)
+    ##  fx is the differential function (derivatives for the
+    ##  Hermite interpolation between the steps, 4th order as
+    ##  the Runge-Kutta method)
+    ##  chunk is the number of steps kept in memory
+    ##  Returns t_out and the (len(t_out), len(q)) array of
+    ##  solutions (shorter if integrate stops early, see
+    ##  CB_events)
+    ##  The adaptive method of CB_adaptive has its own
+    ##  interpolation (t_out argument of integrate_adaptive)
+    ##########
+
+    x = np.array(q, dtype=float)
+    t_out = np.asarray(t_out, dtype=float)
+    q_out = np.empty((t_out.shape[0], x.shape[0]))
+    j = np.searchsorted(t_out, 0., side='right')
+    q_out[0:j] = x
+
+    done = 0
+    while done<number and j<t_out.shape[0]:
+        steps = min(chunk, number-done)
+        q_chunk = integrate(x, m, dt, steps)
+        if q_chunk.shape[0]==0:
+            break
+        q_ext = np.concatenate((x[np.newaxis], q_chunk))
+        j_new = np.searchsorted(t_out, (done+q_chunk.shape[0])*dt, side='right')
+        if j_new>j:
+            ## Step containing each output, and derivatives at the
+            ## ends of these steps only
+            position = t_out[j:j_new]/dt-done
+            k = np.clip(position.astype(int), 0, q_chunk.shape[0]-1)
+            ends = np.unique(np.concatenate((k, k+1)))
+            f = np.array([fx(q_ext[i], m) for i in ends])
+            q_out[j:j_new] = hermite(q_ext[k], f[np.searchsorted(ends, k)],
+                                     q_ext[k+1], f[np.searchsorted(ends, k+1)], dt, position-k)
+            j = j_new
+        done += q_chunk.shape[0]
+        if q_chunk.shape[0]<steps:
+            break
+        x = q_chunk[-1]
+    return t_out[0:j], q_out[0:j]
+
+def energy(q, m):
+
+    ##########
+    ##  Total energy (kinetic + potential) of the 3 bodies
+    ##  q is a position/velocity vector, or an array
+    ##  of vectors (one per line)
+    ##  m contains the bodies masses
+    ##########
+
+    G=9.86e-5 ## In the right units
+
+    q = np.asarray(q, dtype=float)
+    x, y = q[..., 0:6:2], q[..., 1:6:2]
+    vx, vy = q[..., 6:12:2], q[..., 7:12:2]
+
+    Ec = 0.5*(m[0]*(vx[..., 0]**2+vy[..., 0]**2)
+              +m[1]*(vx[..., 1]**2+vy[..., 1]**2)
+              +m[2]*(vx[..., 2]**2+vy[..., 2]**2))
+    Ep = -G*(m[0]*m[1]/np.hypot(x[..., 1]-x[..., 0], y[..., 1]-y[..., 0])
+             +m[0]*m[2]/np.hypot(x[..., 2]-x[..., 0], y[..., 2]-y[..., 0])
+             +m[1]*m[2]/np.hypot(x[..., 2]-x[..., 1], y[..., 2]-y[..., 1]))
+    return Ec+Ep
+
+def angular_momentum(q, m):
+
+    ##########
+    ##  Total angular momentum of the 3 bodies (around the origin)
+    ##  q is a position/velocity vector, or an array
+    ##  of vectors (one per line)
+    ##  m contains the bodies masses
+    ##########
+
+    q = np.asarray(q, dtype=float)
+    x, y = q[..., 0:6:2], q[..., 1:6:2]
+    vx, vy = q[..., 6:12:2], q[..., 7:12:2]
+    return (m[0]*(x[..., 0]*vy[..., 0]-y[..., 0]*vx[..., 0])
+            +m[1]*(x[..., 1]*vy[..., 1]-y[..., 1]*vx[..., 1])
+            +m[2]*(x[..., 2]*vy[..., 2]-y[..., 2]*vx[..., 2]))
+
+def step(r, tfin):
+    
+    ##########
+    ##  Defines the step and the number of iterations
+    ##  These parameters depend on the distance r between bodies
+    ##  the 2 bodies orbiting around each other
+    ##  tfin indicates the length of the simulation, in years
+    ##########
+    
+    dt = 0.005*r**(1./3)
+    number = int(tfin/dt)
+    return dt, number
+
+def step2(m, tfin):
+    
+    ##########
+    ##  Defines the step and the number of iterations
+    ##  These parameters depend on the minimal mass of the 3 bodies
+    ##  m contains the bodies masses
+    ##  tfin indicates the length of the simulation, in years
+    ##########
+    
+    if min(m)<100.0:                ## Earth-like planets and big moons
+        dt = 1.0/100
+        number = int(tfin/dt)
+    if min(m)<0.001:                ## Comets, small bodies
+        dt = 1.0/500
+        number = int(tfin/dt)
+    else:                           ## Stars and big planets
+        dt = 1.0/50
+        number = int(tfin/dt)
+    return dt, number
+
+
+def limits(q):
+    
+    ##########
+    ##  Defines the limits for the final plot
+    ##  q is a position/velocity vector
+    ##  (q[0], ..., q[5] can be memory-mapped arrays, see
+    ##  CB_storage : they are read without being copied)
+    ##########
+    
+    xmax = max(np.max(q[0]), np.max(q[2]), np.max(q[4]))
+    xmin = min(np.min(q[0]), np.min(q[2]), np.min(q[4]))
+    ymax = max(np.max(q[1]), np.max(q[3]), np.max(q[5]))
+    ymin = min(np.min(q[1]), np.min(q[3]), np.min(q[5]))
+    return xmax, xmin, ymax, ymin
@@ -0,0 +1,170 @@
+#########################################################
+#
+#   Title : Ensemble integration for the "cosmic ballet" application
+#   Author: Joanne Breitfelder
+#
+#   Description :
+#   This script integrates a whole batch of 3 bodies
+#   systems in one pass. All the members are advanced
+#   together (lockstep) with a vectorized version of
+#   the force law of CB_core.diff_eq, which is much
+#   faster than running the scalar code once per member
+#   (e.g. for Monte Carlo studies on the initial conditions).
+#
+#   Shapes :
+#   - Q is a (B, 12) array, one position/velocity vector per line
+#   - M is a (B, 3) array, one set of masses per line
+#
+#########################################################
+
+import numpy as np
+
+
+#########################################################
+### Initial conditions
+#########################################################
+
+def initial_conditions(m, r, e, x3, y3, V3x, V3y):
+
+    ##########
+    ##  Builds the (B, 12) state and (B, 3) masses arrays
+    ##  with the same initial conditions as Cosmic_ballet.py
+    ##  (binary centred on the first body, on the x-axis)
+    ##  m is a (3,) or (B, 3) array of masses
+    ##  all other arguments are scalars or (B,) arrays
+    ##########
+
+    G=9.86e-5 ## In the right units
+
+    m = np.atleast_2d(np.asarray(m, dtype=float))
+    r, e, x3, y3, V3x, V3y = np.broadcast_arrays(*[np.asarray(v, dtype=float).ravel()
+                                     for v in (r, e, x3, y3, V3x, V3y)])
+    B = max(m.shape[0], r.shape[0])
+    M = np.empty((B, 3))
+    M[:] = m
+
+    Q = np.zeros((B, 12))
+    Q[:, 2] = r*(1-e)
+    Q[:, 4] = x3
+    Q[:, 5] = y3
+    Q[:, 7] = np.sqrt((1+e)*G*(M[:, 1]**2/(M[:, 0]+M[:, 1]))/(r*(1-e)))
+    Q[:, 9] = -np.sqrt((1+e)*G*(M[:, 0]**2/(M[:, 0]+M[:, 1]))/(r*(1-e)))
+    Q[:, 10] = V3x
+    Q[:, 11] = V3y
+    return Q, M
+
+
+#########################################################
+### Equation resolution
+#########################################################
+
+def diff_eq_batch(Q, M):
+
+    ##########
+    ##  Differential equations for a batch of 3 bodies problems
+    ##  Q is a (B, 12) array of position/velocity vectors
+    ##  M is a (B, 3) array of masses
+    ##  Same force law (and order of operations) as CB_core.diff_eq
+    ##########
+
+    c=3./2.
+    G=9.86e-5 ## In the right units
+
+    x1, y1, x2, y2, x3, y3 = Q[:, 0], Q[:, 1], Q[:, 2], Q[:, 3], Q[:, 4], Q[:, 5]
+    m1, m2, m3 = M[:, 0], M[:, 1], M[:, 2]
+
+    m1m2=((x2-x1)*(x2-x1)+(y2-y1)*(y2-y1))**c
+    m1m3=((x3-x1)*(x3-x1)+(y3-y1)*(y3-y1))**c
+    m2m3=((x3-x2)*(x3-x2)+(y3-y2)*(y3-y2))**c
+
+    Qp = np.empty_like(Q)
+    Qp[:, 0:6] = Q[:, 6:12]
+
+    Qp[:, 6] = G*(m2*(x2-x1)/m1m2+m3*(x3-x1)/m1m3)
+    Qp[:, 7] = G*(m2*(y2-y1)/m1m2+m3*(y3-y1)/m1m3)
+
+    Qp[:, 8] = G*(m1*(x1-x2)/m1m2+m3*(x3-x2)/m2m3)
+    Qp[:, 9] = G*(m1*(y1-y2)/m1m2+m3*(y3-y2)/m2m3)
+
+    Qp[:, 10] = G*(m1*(x1-x3)/m1m3+m2*(x2-x3)/m2m3)
+    Qp[:, 11] = G*(m1*(y1-y3)/m1m3+m2*(y2-y3)/m2m3)
+
+    return Qp
+
+def rKN_batch(X, M, fx, dt):
+
+    ##########
+    ##  Runge-Kutta method applied to every member of the batch
+    ##  X is a (B, 12) array of position/velocity vectors
+    ##  M is a (B, 3) array of masses
+    ##  fx is the batched differential function
+    ##  dt is a scalar or a (B, 1) array of steps
+    ##########
+
+    k1 = fx(X, M)*dt
+    k2 = fx(X+k1*0.5, M)*dt
+    k3 = fx(X+k2*0.5, M)*dt
+    k4 = fx(X+k3, M)*dt
+    return X+(k1+2*(k2+k3)+k4)/6
+
+def integrate_batch(Q, M, dt, number, summary=False, fx=diff_eq_batch):
+
+    ##########
+    ##  Integrates all the members of the batch in lockstep
+    ##  Q is a (B, 12) array of initial position/velocity vectors
+    ##  M is a (B, 3) array of masses
+    ##  dt is a common step, or one step per member ((B,) array)
+    ##  number is the number of iterations
+    ##  If summary is False, returns the (B, number, 12) trajectories
+    ##  If summary is True, the trajectories are not stored and a
+    ##  dictionnary of per-member results is returned instead :
+    ##    'final'    : (B, 12) final states
+    ##    'min_dist' : (B, 3) minimal distances 1-2, 1-3 and 2-3
+    ##    'max_dist' : (B,) maximal distance between the third
+    ##                 body and the first one
+    ##########
+
+    X = np.array(Q, dtype=float, ndmin=2)
+    M = np.asarray(M, dtype=float)
+    if M.ndim==1:
+        M = np.tile(M, (X.shape[0], 1))
+    if np.ndim(dt)>0:
+        dt = np.asarray(dt, dtype=float).reshape(-1, 1)
+
+    if summary:
+        min_dist = np.empty((X.shape[0], 3))
+        min_dist[:] = np.inf
+        max_dist = np.zeros(X.shape[0])
+    else:
+        Q_all = np.empty((X.shape[0], number, X.shape[1]))
+
+    for i in range(number):
+        X = rKN_batch(X, M, fx, dt)
+        if summary:
+            d = distances(X)
+            np.minimum(min_dist, d, out=min_dist)
+            np.maximum(max_dist, d[:, 1], out=max_dist)
+        else:
+            Q_all[:, i] = X
+
+    if summary:
+        return {'final' : X, 'min_dist' : min_dist, 'max_dist' : max_dist}
+    return Q_all
+
+
+#########################################################
+### Useful little tools
+#########################################################
+
+def distances(X):
+
+    ##########
+    ##  Distances 1-2, 1-3 and 2-3 for every member of the batch
+    ##  X is a (B, 12) array of position/velocity vectors
+    ##########
+
+    d = np.empty((X.shape[0], 3))
+    d[:, 0] = np.hypot(X[:, 2]-X[:, 0], X[:, 3]-X[:, 1])
+    d[:, 1] = np.hypot(X[:, 4]-X[:, 0], X[:, 5]-X[:, 1])
+    d[:, 2] = np.hypot(X[:, 4]-X[:, 2], X[:, 5]-X[:, 3])
+    return d
@@ -0,0 +1,400 @@
+#########################################################
+#
+#   Title : Event detection for the "cosmic ballet" application
+#   Author: Joanne Breitfelder
+#
+#   Description :
+#   This script detects what happens to the bodies while
+#   the equations are solved : collisions (or close
+#   encounters), escape of a body, periapsis passages.
+#
+#   An event is described by a function g of the
+#   position/velocity vector : it happens when g changes
+#   sign. After each chunk of steps, g is calculated for
+#   all the steps at once ; when its sign changes between
+#   two steps, the time of the event is found by root
+#   finding (regula falsi), each try being a Runge-Kutta
+#   step of the right length from the previous step.
+#   A fast body can cross the distance of a close encounter
+#   and go away again during one step : the distance is then
+#   bigger at both steps (and the step is too long for the
+#   Runge-Kutta method to be right). When the two bodies pass
+#   their closest point during a step, the time of the
+#   encounter is therefore calculated on their two-body
+#   (Kepler) orbit at the beginning of the step.
+#   The events are recorded with their time, and the
+#   terminal ones (collision, escape) stop the simulation :
+#   the trajectory ends at the last step before the event,
+#   so that no time is spent on an outcome already decided
+#   (and the huge accelerations of a collision are never
+#   calculated for long).
+#
+#   Usage (with any integration function, see CB_backend) :
+#   detector = CB_events.EventDetector(CB_events.default_events(params))
+#   q_all = detector.wrap(CB_core.integrate)(q, params['mass'], dt, number)
+#   detector.records  ## [{'name', 'bodies', 'time', 'step', 'q', 'terminal'}, ...]
+#
+#########################################################
+
+import numpy as np
+import CB_core
+
+
+#########################################################
+### Events
+#########################################################
+
+class Event(object):
+
+    ##########
+    ##  An event : g changes sign
+    ##  name is the name of the event
+    ##  function is g, q being a position/velocity vector or
+    ##  an array of vectors (one per line)
+    ##  direction : +1 (g becomes positive), -1 (g becomes
+    ##  negative) or 0 (both)
+    ##  terminal : if True, the event stops the simulation
+    ##  encounter is used when g can change sign twice during a
+    ##  step (None if it can not) : (minimum, time), minimum
+    ##  becoming positive when g is minimal, time(q) giving the
+    ##  time until the event on the two-body orbit (None if it
+    ##  does not happen)
+    ##  bodies are the bodies concerned (0, 1 or 2)
+    ##########
+
+    def __init__(self, name, function, direction=0, terminal=False, encounter=None, bodies=()):
+        self.name, self.function = name, function
+        self.direction, self.terminal = direction, terminal
+        self.encounter, self.bodies = encounter, list(bodies)
+
+    def crossings(self, g):
+
+        ##########
+        ##  Indices k where g changes sign between g[k] and g[k+1]
+        ##########
+
+        up = (g[:-1]<0) & (g[1:]>=0)
+        down = (g[:-1]>0) & (g[1:]<=0)
+        if self.direction>0:
+            return np.flatnonzero(up)
+        elif self.direction<0:
+            return np.flatnonzero(down)
+        return np.flatnonzero(up | down)
+
+def separation(q, i, j):
+
+    ##########
+    ##  Distance between the bodies i and j (0, 1 or 2)
+    ##  q is a position/velocity vector or an array of vectors
+    ##########
+
+    q = np.asarray(q, dtype=float)
+    return np.hypot(q[..., 2*j]-q[..., 2*i], q[..., 2*j+1]-q[..., 2*i+1])
+
+def encounter_time(q, i, j, m, distance):
+
+    ##########
+    ##  Time until the bodies i and j are at distance from each
+    ##  other, on their two-body orbit (the third body is
+    ##  ignored), when they are approaching each other
+    ##  q is a position/velocity vector
+    ##  m contains the bodies masses
+    ##  Returns None if their closest distance is bigger
+    ##########
+
+    G=9.86e-5 ## In the right units
+
+    mu = G*(m[i]+m[j])
+    x, y = q[2*j]-q[2*i], q[2*j+1]-q[2*i+1]
+    vx, vy = q[6+2*j]-q[6+2*i], q[7+2*j]-q[7+2*i]
+    d0 = np.hypot(x, y)
+    if d0<=distance:
+        return 0.
+    E = 0.5*(vx**2+vy**2)-mu/d0  ## Energy per unit of reduced mass
+    h = x*vy-y*vx                ## Angular momentum per unit of reduced mass
+    e = np.sqrt(max(1+2*E*h**2/mu**2, 0))
+    if h**2/(mu*(1+e))>distance or E==0:
+        return None
+    a = abs(mu/(2*E))
+    n = np.sqrt(mu/a**3)
+    if E<0:
+        ## Ellipse : r = a(1-e cos(u)), mean anomaly u-e sin(u)
+        u0 = -np.arccos(np.clip((1-d0/a)/e, -1, 1))
+        u1 = -np.arccos(np.clip((1-distance/a)/e, -1, 1))
+        return ((u1-e*np.sin(u1))-(u0-e*np.sin(u0)))/n
+    ## Hyperbola : r = a(e cosh(u)-1), mean anomaly e sinh(u)-u
+    u0 = -np.arccosh(max((1+d0/a)/e, 1))
+    u1 = -np.arccosh(max((1+distance/a)/e, 1))
+    return ((e*np.sinh(u1)-u1)-(e*np.sinh(u0)-u0))/n
+
+def close_encounter(i, j, m, distance, terminal=False):
+
+    ##########
+    ##  The bodies i and j come closer than distance
+    ##  m contains the bodies masses
+    ##########
+
+    return Event('close encounter %d-%d' % (i+1, j+1),
+                 lambda q: separation(q, i, j)-distance, -1, terminal,
+                 (periapsis(i, j).function, lambda q: encounter_time(q, i, j, m, distance)), (i, j))
+
+def collision(i, j, m, distance):
+
+    ##########
+    ##  The bodies i and j come closer than distance (sum of
+    ##  their radius) : the simulation stops
+    ##  m contains the bodies masses
+    ##########
+
+    event = close_encounter(i, j, m, distance, terminal=True)
+    event.name = 'collision %d-%d' % (i+1, j+1)
+    return event
+
+def relative_orbit(q, k, m):
+
+    ##########
+    ##  Position/velocity of the body k relative to the center
+    ##  of mass of the two others, and G times their total mass
+    ##  q is a position/velocity vector or an array of vectors
+    ##  m contains the bodies masses
+    ##  Returns dx, dy, dvx, dvy, mu
+    ##########
+
+    G=9.86e-5 ## In the right units
+
+    q = np.asarray(q, dtype=float)
+    i, j = [n for n in range(3) if n!=k]
+    M = m[i]+m[j]
+    dx = q[..., 2*k]-(m[i]*q[..., 2*i]+m[j]*q[..., 2*j])/M
+    dy = q[..., 2*k+1]-(m[i]*q[..., 2*i+1]+m[j]*q[..., 2*j+1])/M
+    dvx = q[..., 6+2*k]-(m[i]*q[..., 6+2*i]+m[j]*q[..., 6+2*j])/M
+    dvy = q[..., 7+2*k]-(m[i]*q[..., 7+2*i]+m[j]*q[..., 7+2*j])/M
+    return dx, dy, dvx, dvy, G*(M+m[k])
+
+def pair_orbit(q, i, k, m):
+
+    ##########
+    ##  Position/velocity of the body k relative to the body i
+    ##  (two-body orbit, the third body being ignored), and G
+    ##  times their total mass
+    ##  Returns dx, dy, dvx, dvy, mu
+    ##########
+
+    G=9.86e-5 ## In the right units
+
+    q = np.asarray(q, dtype=float)
+    return (q[..., 2*k]-q[..., 2*i], q[..., 2*k+1]-q[..., 2*i+1],
+            q[..., 6+2*k]-q[..., 6+2*i], q[..., 7+2*k]-q[..., 7+2*i], G*(m[i]+m[k]))
+
+def orbit_energy(q, k, m, i=None):
+
+    ##########
+    ##  Energy (per unit of reduced mass) of the body k relative
+    ##  to the two others (or to the body i only, see pair_orbit) :
+    ##  negative if it is bound to them
+    ##########
+
+    dx, dy, dvx, dvy, mu = relative_orbit(q, k, m) if i is None else pair_orbit(q, i, k, m)
+    return 0.5*(dvx**2+dvy**2)-mu/np.hypot(dx, dy)
+
+def eccentricity(q, k, m, i=None):
+
+    ##########
+    ##  Eccentricity of the orbit of the body k around the
+    ##  center of mass of the two others (or around the body i,
+    ##  see pair_orbit) : 1 or more if it is unbound
+    ##########
+
+    dx, dy, dvx, dvy, mu = relative_orbit(q, k, m) if i is None else pair_orbit(q, i, k, m)
+    E = 0.5*(dvx**2+dvy**2)-mu/np.hypot(dx, dy)
+    h = dx*dvy-dy*dvx
+    return np.sqrt(np.maximum(1+2*E*h**2/mu**2, 0))
+
+def escape(k, m, radius, terminal=True):
+
+    ##########
+    ##  The body k escapes : it is farther than radius from the
+    ##  center of mass of the two others, and its energy
+    ##  relative to them is positive (it will never come back)
+    ##  m contains the bodies masses
+    ##########
+
+    def function(q):
+        dx, dy, dvx, dvy, mu = relative_orbit(q, k, m)
+        d = np.hypot(dx, dy)
+        return np.minimum(d-radius, 0.5*(dvx**2+dvy**2)-mu/d)
+
+    return Event('escape %d' % (k+1), function, +1, terminal, bodies=(k,))
+
+def periapsis(i, j):
+
+    ##########
+    ##  The body j passes at its closest point to the body i
+    ##  (the distance stops decreasing)
+    ##########
+
+    def function(q):
+        q = np.asarray(q, dtype=float)
+        return ((q[..., 2*j]-q[..., 2*i])*(q[..., 6+2*j]-q[..., 6+2*i])
+                +(q[..., 2*j+1]-q[..., 2*i+1])*(q[..., 7+2*j]-q[..., 7+2*i]))
+
+    return Event('periapsis %d-%d' % (i+1, j+1), function, +1, bodies=(i, j))
+
+def default_events(params, collision_distance=None, escape_radius=None, passages=True):
+
+    ##########
+    ##  Events of a simulation of Cosmic_ballet.py
+    ##  - collision of any two bodies (closer than
+    ##    collision_distance, by default 0.1% of r)
+    ##  - escape of any body (farther than escape_radius, by
+    ##    default 3 times the size of the initial system)
+    ##  - periapsis passages of the third body (if passages)
+    ##  params contains a dictionnary of parameters
+    ##########
+
+    r = params['r']
+    if collision_distance is None:
+        collision_distance = 0.001*r
+    if escape_radius is None:
+        escape_radius = 3*max(r, np.hypot(params['x3'], params['y3']))
+
+    m = params['mass']
+    events = ([collision(0, 1, m, collision_distance), collision(0, 2, m, collision_distance),
+               collision(1, 2, m, collision_distance)]
+              +[escape(k, m, escape_radius) for k in range(3)])
+    if passages:
+        events += [periapsis(0, 2), periapsis(1, 2)]
+    return events
+
+
+#########################################################
+### Detection
+#########################################################
+
+def locate(event, q, m, dt, g0, g1, tol=1e-12, iterations=60):
+
+    ##########
+    ##  Time of the event during the step dt starting at q
+    ##  g0, g1 are the values of g at the beginning and at
+    ##  the end of the step (of opposite signs)
+    ##  m contains the bodies masses
+    ##  tol is the precision, relative to dt
+    ##  Returns the time since q and the position/velocity
+    ##  vector at this time
+    ##########
+
+    q = np.asarray(q, dtype=float)
+    n = q.shape[0]
+    a, b, ga, gb = 0., dt, g0, g1
+    s, q_s = dt, None
+    side = 0
+    for iteration in range(iterations):
+        ## Regula falsi, with the Illinois correction (the end
+        ## which does not move sees its value divided by 2)
+        s = (a*gb-b*ga)/(gb-ga)
+        if not a<s<b:
+            s = 0.5*(a+b)
+        q_s = CB_core.rKN(q, m, CB_core.diff_eq, n, s)
+        gs = event.function(q_s)
+        if gs==0:
+            break
+        if (gs<0)==(ga<0):
+            a, ga = s, gs
+            if side==-1:
+                gb *= 0.5
+            side = -1
+        else:
+            b, gb = s, gs
+            if side==1:
+                ga *= 0.5
+            side = 1
+        if b-a<tol*dt:
+            break
+    return s, q_s
+
+class EventDetector(object):
+
+    ##########
+    ##  Detects events while the equations are solved
+    ##  events is a list of Event
+    ##  chunk is the number of steps between two detections
+    ##  (the work done after a terminal event is at most chunk
+    ##  steps)
+    ##  records lists the events, in the order of time
+    ##  terminated is the record of the terminal event which
+    ##  stopped the simulation (None if it was not stopped)
+    ##########
+
+    def __init__(self, events, chunk=1000):
+        self.events, self.chunk = events, chunk
+        self.step = 0  ## Steps done
+        self.records = []
+        self.terminated = None
+
+    def check(self, q, q_chunk, m, dt):
+
+        ##########
+        ##  Looks for events in the steps q_chunk following q
+        ##  Returns the number of steps to keep (all of them if no
+        ##  terminal event happened)
+        ##########
+
+        q_ext = np.concatenate((np.asarray(q, dtype=float)[np.newaxis], q_chunk))
+        found = []
+        for event in self.events:
+            g = event.function(q_ext)
+            crossings = [(k, None) for k in event.crossings(g)]
+            if event.encounter is not None:
+                ## Minimum during a step, g being positive at both ends
+                minimum, time = event.encounter
+                h = minimum(q_ext)
+                for k in np.flatnonzero((h[:-1]<0) & (h[1:]>=0) & (g[:-1]>0) & (g[1:]>0)):
+                    s = time(q_ext[k])
+                    if s is not None and s<=dt:
+                        crossings.append((k, s))
+                crossings.sort()
+            for k, s in crossings:
+                if s is None:
+                    s, q_event = locate(event, q_ext[k], m, dt, g[k], g[k+1])
+                else:
+                    q_event = CB_core.rKN(q_ext[k], m, CB_core.diff_eq, q_ext.shape[1], s)
+                found.append({'name' : event.name, 'bodies' : event.bodies, 'time' : (self.step+k)*dt+s,
+                              'step' : self.step+k, 'q' : q_event.tolist(), 'terminal' : event.terminal})
+                if event.terminal:
+                    break  ## The next ones would not happen
+        found.sort(key=lambda record: record['time'])
+
+        kept = q_chunk.shape[0]
+        for record in found:
+            self.records.append(record)
+            if record['terminal']:
+                self.terminated = record
+                kept = record['step']-self.step
+                break
+        return kept
+
+    def wrap(self, integrate):
+
+        ##########
+        ##  Returns integrate (same arguments and result), the
+        ##  events being detected every self.chunk steps
+        ##  After a terminal event, the result is shorter than
+        ##  number steps (and empty for the next calls)
+        ##  Successive calls continue the same simulation
+        ##########
+
+        def detected(q, m, dt, number):
+            q = np.array(q, dtype=float)
+            q_all = np.empty((number, q.shape[0]))
+            done = 0
+            while done<number and self.terminated is None:
+                steps = min(self.chunk, number-done)
+                q_chunk = integrate(q, m, dt, steps)
+                kept = self.check(q, q_chunk, m, dt)
+                q_all[done:done+kept] = q_chunk[0:kept]
+                done += kept
+                self.step += kept
+                if kept>0:
+                    q = q_all[done-1]
+            return q_all[0:done]
+        return detected
@@ -0,0 +1,215 @@
+#########################################################
+#
+#   Title : Movies of the "cosmic ballet" animation
+#   Author: Joanne Breitfelder
+#
+#   Description :
+#   This script makes a movie of the animation without
+#   opening any window. The images are drawn in parallel
+#   by several processes (Agg backend) and sent in order
+#   to ffmpeg through a pipe, which writes a single video
+#   (.mp4, .mkv) or animated image (.gif) : no image
+#   file is written, unless asked.
+#
+#   The images are the same as the ones of
+#   CB_tools.animation (see animation_figure and
+#   animation_frame).
+#
+#   The processes draw blocks of successive images : each
+#   one receives only the steps shown by its block (and the
+#   limits of the plot), not the whole trajectory.
+#
+#   How to use it :
+#   - ffmpeg must be installed (only the PNG images can
+#     be written without it)
+#   - CB_export.export_animation(q_all, params, 'ballet.mp4')
+#   - or run "python CB_export.py 1 ballet.mp4" to make the
+#     movie of the pre-registered scenario 1
+#   - On Windows, the call must be protected by
+#     if __name__=='__main__' (see multiprocessing)
+#
+#########################################################
+
+import os
+import sys
+import subprocess
+import multiprocessing
+import numpy as np
+from matplotlib import font_manager
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import CB_tools
+
+## Options of ffmpeg for each type of file
+codecs = {'.mp4' : ['-vcodec', 'libx264', '-pix_fmt', 'yuv420p', '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2'],
+          '.mkv' : ['-vcodec', 'libx264', '-pix_fmt', 'yuv420p', '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2'],
+          '.gif' : []}
+
+
+#########################################################
+### Drawing the images (in each process)
+#########################################################
+
+## Figure of the current process (see init_worker)
+worker = {}
+
+def init_worker(q_bounds, params, dt, dpi, directory):
+
+    ##########
+    ##  Prepares the figure of a process
+    ##  q_bounds is an array whose limits (see CB_core.limits)
+    ##  are the ones of the whole trajectory
+    ##  params contains a dictionnary of parameters
+    ##  dt is the step
+    ##  dpi is the resolution of the images
+    ##  directory is the path to save the PNG images (None
+    ##  if they are not saved)
+    ##########
+
+    ## The fonts already opened by the parent process share their
+    ## file position with it : each process opens its own fonts
+    if hasattr(font_manager, '_get_font'):
+        font_manager._get_font.cache_clear()
+
+    fig = Figure(figsize=(12, 6), dpi=dpi)
+    FigureCanvasAgg(fig)
+    worker['fig'], worker['params'], worker['dt'] = fig, params, dt
+    worker['directory'] = directory
+    worker['artists'] = CB_tools.animation_figure(fig, q_bounds, params)
+
+def frame_blocks(q, frames, size, n=300):
+
+    ##########
+    ##  Splits the images in blocks of size successive images
+    ##  q is a position/velocity vector (its lines can be
+    ##  memory-mapped arrays, see CB_storage)
+    ##  frames are (number of the image, step)
+    ##  n is the number of steps of the visible trajectories
+    ##  Returns the blocks (see render_block), one by one
+    ##########
+
+    for k in range(0, len(frames), size):
+        block = frames[k:k+size]
+        offset = max(block[0][1]-n, 0)
+        yield block, offset, np.array([line[offset:block[-1][1]+1] for line in q[0:6]])
+
+def render_block(block):
+
+    ##########
+    ##  Draws successive images of the animation
+    ##  block is (frames, offset, q) : frames are (number of
+    ##  the image, step), q the positions from the step offset
+    ##  to the last step of the block
+    ##  Returns the list of the RGBA pixels of the images (bytes)
+    ##########
+
+    frames, offset, q = block
+    fig = worker['fig']
+    images = []
+    for j, i in frames:
+        CB_tools.animation_frame(q, worker['params'], worker['dt'], i, worker['artists'], offset=offset)
+        fig.canvas.draw()
+        images.append(np.asarray(fig.canvas.buffer_rgba()).tobytes())
+        if worker['directory'] is not None:
+            fig.savefig(os.path.join(worker['directory'], str(j)+'.png'))
+    return images
+
+
+#########################################################
+### Movie
+#########################################################
+
+def open_video(filename, size, fps=25, ffmpeg='ffmpeg'):
+
+    ##########
+    ##  Starts ffmpeg, which reads the images on its input
+    ##  filename is the video file (.mp4, .mkv or .gif)
+    ##  size is the (width, height) of the images, in pixels
+    ##  fps is the number of images per second
+    ##  Returns the ffmpeg process
+    ##########
+
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in codecs:
+        raise ValueError('Unknown type of video %r (known types : %s)' % (extension, sorted(codecs)))
+    command = [ffmpeg, '-y', '-loglevel', 'error',
+               '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', '%dx%d' % size, '-r', str(fps),
+               '-i', '-']+codecs[extension]+[filename]
+    try:
+        return subprocess.Popen(command, stdin=subprocess.PIPE)
+    except OSError:
+        raise IOError('%s is needed to write %s (use filename=None to only save the images)' % (ffmpeg, filename))
+
+def export_animation(q, params, filename='animation.mp4', directory=None, processes=None,
+                     fps=25, dpi=100, ffmpeg='ffmpeg'):
+
+    ##########
+    ##  Makes the movie of the simulation
+    ##  q is a position/velocity vector
+    ##  params contains a dictionnary of parameters
+    ##  filename is the video file (None : no video)
+    ##  directory is the path to save the PNG images
+    ##  (None : no images)
+    ##  processes is the number of processes drawing the
+    ##  images (by default, the number of cores)
+    ##  fps is the number of images per second
+    ##  dpi is the resolution of the images
+    ##  ffmpeg is the ffmpeg program
+    ##  Returns the number of images
+    ##########
+
+    if directory is not None and not os.path.exists(directory):
+        os.makedirs(directory)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    number = len(q[0])
+    dt = CB_tools.step(params['r'], params['tfin'])[0]
+    frames = list(enumerate(CB_tools.frame_schedule(number)))
+
+    video = None
+    if filename is not None:
+        size = FigureCanvasAgg(Figure(figsize=(12, 6), dpi=dpi)).get_width_height()
+        video = open_video(filename, size, fps, ffmpeg)
+
+    ## Each process draws blocks of successive images, which
+    ## are given back in order
+    q_bounds = np.array([[np.min(q[k]), np.max(q[k])] for k in range(6)])
+    blocks = frame_blocks(q, frames, max(len(frames)//(4*processes), 1))
+    pool = None
+    if processes>1:
+        pool = multiprocessing.Pool(processes, init_worker, (q_bounds, params, dt, dpi, directory))
+        images = pool.imap(render_block, blocks)
+    else:
+        init_worker(q_bounds, params, dt, dpi, directory)
+        images = (render_block(block) for block in blocks)
+
+    try:
+        for block in images:
+            for image in block:
+                if video is not None:
+                    video.stdin.write(image)
+        if video is not None:
+            video.stdin.close()
+            if video.wait()!=0:
+                raise IOError('%s could not write %s' % (ffmpeg, filename))
+    finally:
+        if pool is not None:
+            pool.terminate()
+        ## After an error, ffmpeg is stopped (the error is not hidden
+        ## by the one of ffmpeg, whose movie is not finished)
+        if video is not None and video.poll() is None:
+            video.kill()
+            video.wait()
+        if video is not None and not video.stdin.closed:
+            video.stdin.close()
+    return len(frames)
+
+
+if __name__=='__main__':
+    k = int(sys.argv[1]) if len(sys.argv)>1 else 1
+    filename = sys.argv[2] if len(sys.argv)>2 else 'animation.mp4'
+    params = CB_tools.preset_parameters(k)
+    dt, number = CB_tools.step(params['r'], params['tfin'])
+    q_all = CB_tools.integrate(CB_tools.initial_vector(params), params['mass'], dt, number)[:, 0:6].T
+    print('%d images written to %s' % (export_animation(q_all, params, filename), filename))
@@ -0,0 +1,343 @@
+#########################################################
+#
+#   Title : Live animation for the "cosmic ballet" application
+#   Author: Joanne Breitfelder
+#
+#   Description :
+#   This script shows the animation while the equations
+#   are solved, instead of after the whole simulation : the
+#   first image appears after the first chunk of steps,
+#   whatever the length of the simulation.
+#
+#   - Producer : a thread which solves the equations chunk
+#     by chunk and puts the chunks in a queue of limited size
+#     (the thread waits when the animation is late, so that
+#     the memory used stays small). The steps already in the
+#     cache (see CB_cache) or in a trajectory file (see
+#     CB_storage) are put in the queue first, then the extra
+#     steps as they are calculated
+#   - live_animation : takes the chunks from the queue and
+#     draws the images (same images as CB_tools.animation)
+#     as soon as their steps are calculated
+#   - TrailBuffer : the last n positions (visible part of the
+#     trajectories), in a circular buffer of fixed size
+#
+#   The limits of the plot are not known before the end of
+#   the simulation : they start around the initial positions,
+#   and grow when a body goes out of the plot.
+#
+#   Usage :
+#   producer = CB_live.Producer(q, params['mass'], dt, number)
+#   CB_live.live_animation(producer, params)
+#   q_all = producer.result
+#
+#   With the cache (or CB_storage.extend_to_file) :
+#   solve = lambda tee, reused: cache.integrate(q, params, dt, number, wrap=tee, reused=reused)
+#   producer = CB_live.Producer(q, params['mass'], dt, number, solve=solve)
+#   CB_live.live_animation(producer, params)
+#   q_all, checks = producer.result
+#
+#########################################################
+
+import threading
+import numpy as np
+import CB_core
+import CB_tools
+
+try:
+    import Queue as queue ## python 2
+except ImportError:
+    import queue
+
+
+#########################################################
+### Integration thread
+#########################################################
+
+class Producer(threading.Thread):
+
+    ##########
+    ##  Solves the equations in a separate thread
+    ##  q is the initial position/velocity vector
+    ##  m contains the bodies masses
+    ##  dt and number are given by the step function
+    ##  integrate is the integration function (see CB_backend,
+    ##  CB_monitor and CB_events)
+    ##  chunk is the number of steps of each chunk
+    ##  size is the maximal number of chunks in the queue
+    ##  solve is a function solve(tee, reused) which calculates
+    ##  the trajectory, the integration function (with its
+    ##  checks) being wrapped by tee and the steps already
+    ##  calculated given to reused, see CB_cache.TrajectoryCache.integrate
+    ##  and CB_storage.extend_to_file (None : the trajectory is
+    ##  integrate(q, m, dt, number))
+    ##  The chunks are put in self.queue, then None at the end
+    ##  The result of solve is put in self.result
+    ##########
+
+    def __init__(self, q, m, dt, number, integrate=CB_core.integrate, chunk=1000, size=8, solve=None):
+        threading.Thread.__init__(self)
+        self.daemon = True ## The application can stop during a simulation
+        self.q, self.m, self.dt, self.number = np.array(q, dtype=float), m, dt, number
+        self.integrate, self.chunk, self.solve = integrate, chunk, solve
+        self.queue = queue.Queue(size)
+        self.stopped = threading.Event()
+        self.done = 0  ## Steps put in the queue
+        self.result = None
+        self.error = None
+
+    def run(self):
+        try:
+            if self.solve is None:
+                self.result = self.tee(self.integrate)(self.q, self.m, self.dt, self.number)
+            else:
+                self.result = self.solve(self.tee, self.reused)
+        except Exception as error:
+            self.error = error
+        finally:
+            self.put(None)
+
+    def tee(self, integrate):
+
+        ##########
+        ##  Returns integrate (same arguments and result), the
+        ##  steps being put in the queue chunk by chunk
+        ##  When the producer is stopped, the result is shorter,
+        ##  as after a terminal event (see CB_events)
+        ##########
+
+        def teed(q, m, dt, number):
+            q = np.array(q, dtype=float)
+            chunks, done = [np.empty((0, q.shape[0]))], 0
+            while done<number and not self.stopped.is_set():
+                steps = min(self.chunk, number-done)
+                q_chunk = integrate(q, m, dt, steps)
+                chunks.append(q_chunk)
+                self.emit(q_chunk)
+                done += q_chunk.shape[0]
+                if q_chunk.shape[0]<steps:
+                    break  ## Stopped by an event
+                q = q_chunk[-1]
+            return np.concatenate(chunks)
+        return teed
+
+    def reused(self, q_old):
+
+        ##########
+        ##  Puts the steps q_old (already calculated) in the queue
+        ##########
+
+        for k in range(0, q_old.shape[0], self.chunk):
+            if self.stopped.is_set():
+                return
+            self.emit(np.array(q_old[k:k+self.chunk]))
+
+    def emit(self, q_chunk):
+        self.done += q_chunk.shape[0]
+        self.put(q_chunk)
+
+    def put(self, item):
+
+        ##########
+        ##  Puts item in the queue, waiting while it is full
+        ##  (unless the thread is stopped)
+        ##########
+
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def stop(self):
+        self.stopped.set()
+
+
+#########################################################
+### Trails
+#########################################################
+
+class TrailBuffer(object):
+
+    ##########
+    ##  Circular buffer of the last n lines added
+    ##  width is the number of columns
+    ##########
+
+    def __init__(self, n, width):
+        self.data = np.empty((n, width))
+        self.start = 0  ## Index of the oldest line
+        self.count = 0  ## Number of lines
+
+    def append(self, lines):
+        n = self.data.shape[0]
+        lines = np.asarray(lines)[-n:]
+        k = lines.shape[0]
+        end = (self.start+self.count)%n
+        first = min(k, n-end)
+        self.data[end:end+first] = lines[0:first]
+        self.data[0:k-first] = lines[first:]
+        if self.count+k>n:
+            self.start = (self.start+self.count+k-n)%n
+        self.count = min(self.count+k, n)
+
+    def values(self):
+
+        ##########
+        ##  Returns the lines, from the oldest to the newest
+        ##########
+
+        if self.start+self.count<=self.data.shape[0]:
+            return self.data[self.start:self.start+self.count]
+        return np.concatenate((self.data[self.start:], self.data[0:self.start+self.count-self.data.shape[0]]))
+
+
+#########################################################
+### Animation
+#########################################################
+
+def bounds(points, r, margin=0.5):
+
+    ##########
+    ##  Limits of the plot around the positions of the bodies
+    ##  points is an array of positions (x1, y1, x2, ..., y3),
+    ##  one line per step
+    ##  r is the size of the system (minimal size of the plot)
+    ##  margin is the fraction of the size added on each side
+    ##  Returns a (6, 2) array, whose limits (see CB_core.limits)
+    ##  are the limits of the plot
+    ##########
+
+    x, y = points[:, 0:6:2], points[:, 1:6:2]
+    center = [0.5*(x.max()+x.min()), 0.5*(y.max()+y.min())]
+    size = max(x.max()-x.min(), y.max()-y.min(), r)*(0.5+margin)
+    q = np.empty((6, 2))
+    q[0::2] = [center[0]-size, center[0]+size]
+    q[1::2] = [center[1]-size, center[1]+size]
+    return q
+
+def grow(q_bounds, position, r):
+
+    ##########
+    ##  Limits of the plot containing the previous limits
+    ##  q_bounds (see bounds) and the position of the bodies,
+    ##  or q_bounds if the bodies are inside
+    ##  position is (x1, y1, x2, ..., y3)
+    ##########
+
+    xmax, xmin, ymax, ymin = CB_core.limits(q_bounds)
+    x, y = position[0:6:2], position[1:6:2]
+    if x.min()>=xmin and x.max()<=xmax and y.min()>=ymin and y.max()<=ymax:
+        return q_bounds
+    corners = np.array([[xmin, ymin]*3, [xmax, ymax]*3])
+    return bounds(np.vstack((corners, position)), r)
+
+def live_frame(trail, params, dt, i, artists):
+
+    ##########
+    ##  Updates the moving artists for the step i (same
+    ##  images as CB_tools.animation_frame)
+    ##  trail is the array of the last positions, the last
+    ##  line being the step i
+    ##  params contains a dictionnary of parameters
+    ##  dt is the step
+    ##  artists are given by CB_tools.animation_figure
+    ##########
+
+    trails, points, title = artists[0:3], artists[3:6], artists[6]
+    for k, lc in enumerate(trails):
+        x, y = trail[:-1, 2*k], trail[:-1, 2*k+1]
+        lc.set_segments(CB_tools.segments(x, y))
+        lc.set_array(np.linspace(0, 1, x.shape[0])[:-1])
+        points[k].set_data([trail[-1, 2*k]], [trail[-1, 2*k+1]])
+
+    time = dt*(i+1)
+    title.set_text('trajectories calculated over ' + str(int(time)) + ' years')
+
+def live_animation(producer, params, blit=True, n=300):
+
+    ##########
+    ##  Shows the animation while the producer solves the
+    ##  equations (the producer is started here)
+    ##  params contains a dictionnary of parameters
+    ##  blit allows to redraw only the moving artists
+    ##  n is the number of steps of the visible trajectories
+    ##  The chunks are read until the producer has finished
+    ##  (after the last image too), the producer is only stopped
+    ##  if the window is closed ; its thread is finished when
+    ##  this function returns (its results can be read)
+    ##  Returns the number of images
+    ##########
+
+    import matplotlib.pyplot as plt
+
+    number = producer.number
+    frames = CB_tools.frame_schedule(number)
+    trail = TrailBuffer(n+1, 6)
+    q_bounds = bounds(producer.q[np.newaxis, 0:6], params['r'])
+
+    fig = plt.figure(0, figsize=(12, 6))
+    plt.ion()
+    plt.show()
+
+    def new_figure():
+        ## (Again when the limits change)
+        plt.ioff()
+        fig.clf()
+        artists = CB_tools.animation_figure(fig, q_bounds, params, animated=blit)
+        fig.canvas.draw()
+        plt.ion()
+        return artists, (fig.canvas.copy_from_bbox(fig.bbox) if blit else None)
+
+    artists, background = new_figure()
+    producer.start()
+    shown, step = 0, 0
+    finished = False
+    try:
+        while True:
+            q_chunk = producer.queue.get()
+            if q_chunk is None:
+                finished = True
+                break
+            if not plt.fignum_exists(0):
+                return shown
+            positions = q_chunk[:, 0:6]
+            first, step = step, step+positions.shape[0]
+
+            ## Images whose step is in this chunk (each step goes
+            ## once into the trails)
+            k = 0
+            while shown<len(frames) and frames[shown]<step:
+                i = frames[shown]
+                trail.append(positions[k:i-first+1])
+                k = i-first+1
+
+                new_bounds = grow(q_bounds, positions[i-first], params['r'])
+                if new_bounds is not q_bounds:
+                    q_bounds = new_bounds
+                    artists, background = new_figure()
+
+                plt.ioff()
+                live_frame(trail.values(), params, producer.dt, i, artists)
+                if blit:
+                    fig.canvas.restore_region(background)
+                    for artist in artists:
+                        fig.axes[0].draw_artist(artist)
+                    fig.canvas.blit(fig.bbox)
+                else:
+                    fig.canvas.draw()
+                plt.ion()
+                fig.canvas.flush_events()
+                shown += 1
+                if not plt.fignum_exists(0):
+                    return shown
+            trail.append(positions[k:])
+            fig.canvas.flush_events()
+    finally:
+        if not finished:
+            producer.stop() ## Window closed (or error)
+        producer.join()
+    if producer.error is not None:
+        raise producer.error
+    return shown
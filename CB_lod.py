@@ -0,0 +1,124 @@
+#########################################################
+#
+#   Title : Levels of detail for the "cosmic ballet" plots
+#   Author: Joanne Breitfelder
+#
+#   Description :
+#   This script simplifies the trajectories before they are
+#   plotted, so that the plotting time does not depend on
+#   the number of steps of the simulation.
+#
+#   A pyramid of simplified versions of a trajectory is built
+#   (level k has a tolerance twice as big as level k-1). From
+#   one level to the next, every other point is removed if it
+#   is closer than the tolerance to the segment joining its
+#   neighbours : straight and slow parts of the trajectory
+#   lose most of their points, while the sharp turns
+#   (periapsis passages, close encounters) are kept.
+#   The plot uses the coarsest level whose error is smaller
+#   than one pixel, unless it has too many points.
+#
+#########################################################
+
+import numpy as np
+
+
+#########################################################
+### Pyramid
+#########################################################
+
+def reduce_level(x, y, index, tol):
+
+    ##########
+    ##  Removes every other point of the trajectory if it is
+    ##  closer than tol to the segment joining its neighbours
+    ##  x, y are the positions of the points
+    ##  index are the points kept at the previous level
+    ##  Returns the points kept at the new level
+    ##########
+
+    if index.shape[0]<3:
+        return index
+    prev, mid, nxt = index[0:-2:2], index[1:-1:2], index[2::2]
+    ux, uy = x[nxt]-x[prev], y[nxt]-y[prev]
+    vx, vy = x[mid]-x[prev], y[mid]-y[prev]
+    length = np.hypot(ux, uy)
+    dist = np.where(length>0, np.abs(ux*vy-uy*vx)/np.where(length>0, length, 1), np.hypot(vx, vy))
+
+    keep = np.ones(index.shape[0], dtype=bool)
+    keep[1:-1:2] = dist>tol
+    return index[keep]
+
+def pyramid(x, y, max_points=50000, depth=16, chunk=2**20):
+
+    ##########
+    ##  Builds the levels of detail of a trajectory
+    ##  x, y are the positions (arrays, or memory-mapped arrays :
+    ##  they are read chunk by chunk)
+    ##  max_points is the maximal number of points of the
+    ##  levels which are kept (bigger levels are never plotted)
+    ##  depth is the number of levels ; the tolerance of the
+    ##  last one is the size of the trajectory
+    ##  Returns a dictionnary :
+    ##    'number' : number of points of the trajectory
+    ##    'tol'    : tolerance of each level (0 for level 0)
+    ##    'size'   : number of points of each level
+    ##    'index'  : points of each level (None if too big)
+    ##########
+
+    n = len(x)
+    extent = 0.
+    for j in range(0, n, chunk):
+        xc, yc = np.asarray(x[j:j+chunk]), np.asarray(y[j:j+chunk])
+        extent = max(extent, xc.max()-xc.min(), yc.max()-yc.min())
+    extent = extent if extent>0 else 1.
+    tol = np.concatenate(([0.], extent*2.**(np.arange(1, depth+1)-depth)))
+
+    ## Each chunk is simplified separately (its ends are kept)
+    size = np.zeros(depth+1, dtype=np.int64)
+    index = [[] for k in range(depth+1)]
+    for j in range(0, max(n-1, 1), chunk):
+        k_end = min(j+chunk+1, n)
+        xc, yc = np.array(x[j:k_end]), np.array(y[j:k_end])
+        idx = np.arange(k_end-j)
+        for k in range(depth+1):
+            if k>0:
+                idx = reduce_level(xc, yc, idx, tol[k])
+            part = idx if j==0 else idx[1:] ## Shared end with the previous chunk
+            size[k] += part.shape[0]
+            if index[k] is not None:
+                index[k] = index[k]+[part+j] if size[k]<=max_points else None
+
+    index = [np.concatenate(i) if i is not None else None for i in index]
+    return {'number' : n, 'tol' : tol, 'size' : size, 'index' : index}
+
+def select_level(pyr, tol_pixel, max_points=50000):
+
+    ##########
+    ##  Chooses the level to plot
+    ##  pyr is given by the pyramid function
+    ##  tol_pixel is the size of a pixel (in data units)
+    ##  Returns the indices of the points to plot : the
+    ##  coarsest level whose error (at most twice its tolerance)
+    ##  is below one pixel, or a coarser one if it has more
+    ##  than max_points points
+    ##########
+
+    k_pixel = np.flatnonzero(2*pyr['tol']<=tol_pixel).max()
+    small = np.flatnonzero(pyr['size']<=max_points)
+    k_budget = small.min() if small.shape[0]>0 else len(pyr['size'])-1
+    k = max(k_pixel, k_budget)
+    if pyr['index'][k] is None:
+        return np.arange(pyr['number'])
+    return pyr['index'][k]
+
+def pixel_size(ax):
+
+    ##########
+    ##  Size of a pixel of the axes ax (in data units)
+    ##########
+
+    box = ax.get_window_extent()
+    xmin, xmax = ax.get_xlim()
+    ymin, ymax = ax.get_ylim()
+    return min((xmax-xmin)/box.width, (ymax-ymin)/box.height)
@@ -0,0 +1,131 @@
+#########################################################
+#
+#   Title : Conservation monitor for the "cosmic ballet" application
+#   Author: Joanne Breitfelder
+#
+#   Description :
+#   This script watches the total energy and angular momentum
+#   of the 3 bodies while the equations are solved. Both are
+#   conserved by the real movement : their relative drift
+#   measures the error of the simulation (for example a step
+#   dt too big for a close encounter).
+#
+#   Every `every` steps, the drift is recorded, and if it is
+#   bigger than a threshold the simulation is stopped
+#   (DriftError) or only flagged.
+#
+#   The drift is relative to the size of the terms of the
+#   initial state (kinetic + |potential| energy, sum of the
+#   |angular momentum| of each body), so that it makes sense
+#   even if the total energy or angular momentum is close to 0.
+#
+#   Usage (with any integration function, see CB_backend) :
+#   monitor = CB_monitor.ConservationMonitor(params['mass'], threshold=1e-6)
+#   q_all = monitor.wrap(CB_core.integrate)(q, params['mass'], dt, number)
+#   monitor.history()  ## {'step', 'energy', 'momentum'}
+#
+#########################################################
+
+import numpy as np
+import CB_core
+
+
+class DriftError(RuntimeError):
+
+    ##########
+    ##  Raised when the drift is bigger than the threshold
+    ##  (the monitor is in the attribute monitor)
+    ##########
+
+    def __init__(self, monitor):
+        RuntimeError.__init__(self, 'Drift of the conserved quantities too big at step %d : energy %.2e, angular momentum %.2e'
+                              % (monitor.flagged, monitor.energy_drift[-1], monitor.momentum_drift[-1]))
+        self.monitor = monitor
+
+
+class ConservationMonitor(object):
+
+    ##########
+    ##  Records the drift of the energy and angular momentum
+    ##  m contains the bodies masses
+    ##  every is the number of steps between two measures
+    ##  threshold is the maximal relative drift (None : no limit)
+    ##  abort : if True, DriftError is raised when the threshold
+    ##  is passed, else the step is only written in flagged
+    ##########
+
+    def __init__(self, m, every=1000, threshold=None, abort=True):
+        self.m, self.every, self.threshold, self.abort = m, every, threshold, abort
+        self.step = 0    ## Steps done
+        self.flagged = None  ## First step where the drift passed the threshold
+        self.steps, self.energy_drift, self.momentum_drift = [], [], []
+        self.reference = None
+
+    def start(self, q):
+
+        ##########
+        ##  Conserved quantities of the initial state q
+        ##########
+
+        m = self.m
+        x, y, vx, vy = q[0:6:2], q[1:6:2], q[6:12:2], q[7:12:2]
+        Ec = 0.5*np.sum(np.asarray(m)*(vx**2+vy**2))
+        Ep = CB_core.energy(q, m)-Ec
+        self.reference = (CB_core.energy(q, m), abs(Ec)+abs(Ep),
+                          CB_core.angular_momentum(q, m), np.sum(np.abs(np.asarray(m)*(x*vy-y*vx))))
+
+    def check(self, q):
+
+        ##########
+        ##  Measures the drift at the state q (after self.step steps)
+        ##########
+
+        E0, E_scale, L0, L_scale = self.reference
+        self.steps.append(self.step)
+        self.energy_drift.append(abs(CB_core.energy(q, self.m)-E0)/E_scale)
+        self.momentum_drift.append(abs(CB_core.angular_momentum(q, self.m)-L0)/L_scale)
+        if (self.threshold is not None and self.flagged is None
+            and max(self.energy_drift[-1], self.momentum_drift[-1])>self.threshold):
+            self.flagged = self.step
+            if self.abort:
+                raise DriftError(self)
+
+    def wrap(self, integrate):
+
+        ##########
+        ##  Returns integrate (same arguments and result), the
+        ##  drift being measured every self.every steps
+        ##  Successive calls continue the same simulation (the
+        ##  initial state is the one of the first call)
+        ##########
+
+        def monitored(q, m, dt, number):
+            q = np.array(q, dtype=float)
+            if self.reference is None:
+                self.start(q)
+            q_all = np.empty((number, q.shape[0]))
+            done = 0
+            while done<number:
+                steps = min(self.every-self.step%self.every, number-done)
+                q_all[done:done+steps] = integrate(q, m, dt, steps)
+                q = q_all[done+steps-1]
+                done += steps
+                self.step += steps
+                if self.step%self.every==0:
+                    self.check(q)
+            return q_all
+        return monitored
+
+    def history(self):
+
+        ##########
+        ##  Returns the recorded drift : dictionnary of arrays
+        ##  'step', 'energy' and 'momentum'
+        ##########
+
+        return {'step' : np.array(self.steps, dtype=np.int64),
+                'energy' : np.array(self.energy_drift),
+                'momentum' : np.array(self.momentum_drift)}
+
+    def max_drift(self):
+        return max(self.energy_drift+self.momentum_drift+[0.])
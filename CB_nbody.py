@@ -0,0 +1,156 @@
+#########################################################
+#
+#   Title : N bodies engine for the "cosmic ballet" application
+#   Author: Joanne Breitfelder
+#
+#   Description :
+#   This script generalises CB_core.diff_eq to any number
+#   of bodies (e.g. a binary system with several planets
+#   or moons).
+#
+#   The position/velocity vector keeps the layout of the
+#   3 bodies case : q = [x1, y1, ..., xN, yN,
+#   V1x, V1y, ..., VNx, VNy]. For N=3 it is the usual
+#   12 elements vector, so diff_eq can be given to
+#   CB_core.integrate, CB_adaptive or CB_symplectic
+#   in place of CB_core.diff_eq.
+#
+#   A scenario is a dictionnary :
+#   {'names' : N names, 'mass' : N masses,
+#    'pos' : (N, 2) positions, 'vel' : (N, 2) velocities,
+#    'tfin' : length of the simulation, 'r' : distance used
+#    by CB_core.step to set dt}
+#
+#########################################################
+
+import numpy as np
+
+
+#########################################################
+### Main functions
+#########################################################
+
+pairs_cache = {}
+
+def pairs(N):
+
+    ##########
+    ##  Indices (i, j) of all the pairs i<j of N bodies
+    ##  (computed once for each N)
+    ##########
+
+    if N not in pairs_cache:
+        pairs_cache[N] = np.triu_indices(N, 1)
+    return pairs_cache[N]
+
+def accelerations(pos, m):
+
+    ##########
+    ##  Gravitational accelerations of N bodies
+    ##  pos is a (N, 2) array of positions
+    ##  m contains the N bodies masses
+    ##  Each pair is computed once and used for both bodies
+    ##  (third law of Newton)
+    ##########
+
+    G=9.86e-5 ## In the right units
+
+    N = pos.shape[0]
+    m = np.asarray(m, dtype=float)
+    i, j = pairs(N)
+
+    d = pos[j]-pos[i]
+    r2 = d[:, 0]*d[:, 0]+d[:, 1]*d[:, 1]
+    f = d/(r2*np.sqrt(r2))[:, None]
+
+    acc = np.empty((N, 2))
+    for k in range(2):
+        acc[:, k] = (np.bincount(i, weights=f[:, k]*m[j], minlength=N)
+                     -np.bincount(j, weights=f[:, k]*m[i], minlength=N))
+    return G*acc
+
+def diff_eq(q, m):
+
+    ##########
+    ##  Differential equations for the N bodies problem
+    ##  q is a position/velocity vector (length 4N)
+    ##  m contains the bodies masses
+    ##########
+
+    q = np.asarray(q, dtype=float)
+    n = q.shape[0]//2
+    qp = np.empty_like(q)
+    qp[0:n] = q[n:]
+    qp[n:] = accelerations(q[0:n].reshape(-1, 2), m).ravel()
+    return qp
+
+
+#########################################################
+### Scenarios
+#########################################################
+
+def binary(m1, m2, r, e):
+
+    ##########
+    ##  Initial positions and velocities of two bodies orbiting
+    ##  around each other (same formulas as in Cosmic_ballet.py)
+    ##  m1, m2 are the masses
+    ##  r is the distance (e=0) or the semi-major axis (e>0)
+    ##  e is the excentricity of the orbit
+    ##  Returns the (2, 2) positions and (2, 2) velocities
+    ##########
+
+    G=9.86e-5 ## In the right units
+
+    pos = np.array([[0., 0.], [r*(1-e), 0.]])
+    vel = np.array([[0., np.sqrt((1+e)*G*(m2**2/(m1+m2))/(r*(1-e)))],
+                    [0., -np.sqrt((1+e)*G*(m1**2/(m1+m2))/(r*(1-e)))]])
+    return pos, vel
+
+def binary_scenario(names, m, r, e, tfin, bodies=[]):
+
+    ##########
+    ##  Builds a scenario made of a binary system and any
+    ##  number of other bodies
+    ##  names, m are the names and masses of the binary
+    ##  r, e describe its orbit (see binary)
+    ##  tfin indicates the length of the simulation, in years
+    ##  bodies is a list of (name, mass, x, y, Vx, Vy) tuples
+    ##########
+
+    pos, vel = binary(m[0], m[1], r, e)
+    scenario = {'names' : list(names[0:2]),
+                'mass' : list(m[0:2]),
+                'r' : r,
+                'e' : e,
+                'tfin' : tfin}
+    pos, vel = [pos], [vel]
+    for name, mass, x, y, Vx, Vy in bodies:
+        scenario['names'].append(name)
+        scenario['mass'].append(mass)
+        pos.append([[x, y]])
+        vel.append([[Vx, Vy]])
+    scenario['pos'] = np.concatenate(pos).astype(float)
+    scenario['vel'] = np.concatenate(vel).astype(float)
+    return scenario
+
+def from_params(params):
+
+    ##########
+    ##  Converts the dictionnary of parameters of
+    ##  Cosmic_ballet.py into a 3 bodies scenario
+    ##########
+
+    return binary_scenario(params['names'], params['mass'], params['r'],
+                           params['e'], params['tfin'],
+                           [(params['names'][2], params['mass'][2], params['x3'],
+                             params['y3'], params['V3x'], params['V3y'])])
+
+def state_vector(scenario):
+
+    ##########
+    ##  Position/velocity vector and masses of a scenario
+    ##########
+
+    q = np.concatenate((np.ravel(scenario['pos']), np.ravel(scenario['vel'])))
+    return q.astype(float), np.asarray(scenario['mass'], dtype=float)
@@ -0,0 +1,345 @@
+#########################################################
+#
+#   Title : Stability maps for the "cosmic ballet" application
+#   Author: Joanne Breitfelder
+#
+#   Description :
+#   This script answers the question "which initial
+#   conditions of the third body lead to a capture, an
+#   escape or a collision ?" for a whole plane of initial
+#   conditions at once (for example (x3, y3) or (x3, V3y))
+#   instead of one simulation at a time.
+#
+#   Each cell of the grid is a simulation of the scenario
+#   with two of its fields changed. The simulation stops at
+#   a collision or an escape (see CB_events : the escape
+#   radius is the same for all the cells, 3 times the size
+#   of the biggest initial system of the grid), and the cell
+#   records :
+#   - the outcome : 1 bound (still together at tfin),
+#     2 unbound (a body is leaving at tfin), 3 escape,
+#     4 collision (0 : not calculated yet)
+#   - the survival time (time of the escape or collision,
+#     tfin otherwise)
+#   - the maximal eccentricity of the orbit of the third
+#     body around the body it is bound to
+#
+#   The system is bound if two bodies form a bound pair (the
+#   tightest one : smallest two-body orbit) and the last body
+#   is bound to this pair. The third body orbits around one
+#   star (S-type planet) if it belongs to the pair, else
+#   around the center of mass of the first two bodies.
+#
+#   The lines of the grid are shared between several
+#   processes, which write their cells directly into the
+#   result file (name.npy, memory-mapped and shared by all
+#   the processes). An interrupted map is resumed where it
+#   stopped : only the missing cells are calculated. The
+#   map is then drawn in name.png, and the grid is
+#   described in name.json.
+#
+#   How to use it :
+#   python CB_stability.py --preset 2 --x x3 -20 20 --y y3 -20 20 -n 512 512 -o map
+#   (python CB_stability.py -h for all the options)
+#   On Windows, the call must be protected by
+#   if __name__=='__main__' (see multiprocessing)
+#
+#########################################################
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+import numpy as np
+import CB_core
+import CB_batch
+import CB_backend
+import CB_events
+
+## Outcomes of a simulation (index : value in the map)
+outcomes = ['not calculated', 'bound', 'unbound', 'escape', 'collision']
+
+## Values recorded for each cell
+fields = ['outcome', 'survival time', 'max eccentricity']
+
+## Pairs of bodies (see tightest_pair)
+pairs = [(0, 1), (0, 2), (1, 2)]
+
+
+#########################################################
+### One cell
+#########################################################
+
+def tightest_pair(q, m):
+
+    ##########
+    ##  Index in pairs of the bound pair of bodies whose
+    ##  two-body orbit is the smallest (smallest semi-major
+    ##  axis), -1 if no pair is bound
+    ##  q is a position/velocity vector or an array of vectors
+    ##  (one result per vector)
+    ##  m contains the bodies masses
+    ##########
+
+    ## -E/mu = 1/(2a) : the biggest one is the smallest orbit
+    binding = np.array([-CB_events.orbit_energy(q, k, m, i)/CB_events.pair_orbit(q, i, k, m)[4]
+                        for i, k in pairs])
+    return np.where(np.max(binding, axis=0)>0, np.argmax(binding, axis=0), -1)
+
+def third_eccentricity(q, m):
+
+    ##########
+    ##  Eccentricity of the orbit of the third body around the
+    ##  star it is bound to (if they are the tightest pair, see
+    ##  tightest_pair), else around the center of mass of the
+    ##  two stars
+    ##  q is a position/velocity vector or an array of vectors
+    ##########
+
+    pair = tightest_pair(q, m)
+    e = CB_events.eccentricity(q, 2, m)
+    for p, (i, k) in enumerate(pairs):
+        if k==2:
+            e = np.where(pair==p, CB_events.eccentricity(q, 2, m, i), e)
+    return e
+
+def run_cell(scenario, escape_radius=None, backend=None, chunk=1000):
+
+    ##########
+    ##  Solves a scenario until tfin, a collision or an escape
+    ##  scenario is a dictionnary (see CB_batch)
+    ##  escape_radius is given to CB_events.default_events
+    ##  backend is the integration backend (see CB_backend)
+    ##  chunk is the number of steps kept in memory
+    ##  Returns the outcome, the survival time and the maximal
+    ##  eccentricity of the third body
+    ##########
+
+    params = CB_batch.scenario_parameters(scenario)
+    m = params['mass']
+    dt, number = CB_core.step(params['r'], params['tfin'])
+    events = CB_events.default_events(params, escape_radius=escape_radius, passages=False)
+    detector = CB_events.EventDetector(events, chunk)
+    integrate = detector.wrap(CB_backend.get_backend(backend))
+
+    q = np.array(CB_core.initial_vector(params), dtype=float)
+    max_e = float(third_eccentricity(q, m))
+    done = 0
+    while done<number:
+        steps = min(chunk, number-done)
+        q_chunk = integrate(q, m, dt, steps)
+        if q_chunk.shape[0]>0:
+            max_e = max(max_e, np.max(third_eccentricity(q_chunk, m)))
+            q = q_chunk[-1]
+        done += q_chunk.shape[0]
+        if q_chunk.shape[0]<steps:
+            break
+
+    event = detector.terminated
+    if event is not None:
+        return (4 if event['name'].startswith('collision') else 3), event['time'], max_e
+    pair = tightest_pair(q, m)
+    unbound = pair<0 or CB_events.orbit_energy(q, 3-sum(pairs[pair]), m)>0
+    return (2 if unbound else 1), number*dt, max_e
+
+
+#########################################################
+### Grid (in each process)
+#########################################################
+
+## Map of the current process (see init_worker)
+worker = {}
+
+def init_worker(filename, grid, backend):
+
+    ##########
+    ##  Opens the result file in the process
+    ##  grid is the description of the map (see stability_map)
+    ##########
+
+    worker['map'] = np.load(filename, mmap_mode='r+')
+    worker['grid'], worker['backend'] = grid, backend
+
+def run_line(j):
+
+    ##########
+    ##  Calculates the missing cells of the line j of the map
+    ##  Returns j and the number of cells calculated
+    ##########
+
+    grid, result = worker['grid'], worker['map']
+    (x_name, x_min, x_max), (y_name, y_min, y_max) = grid['x'], grid['y']
+    nx, ny = grid['shape']
+    y = np.linspace(y_min, y_max, ny)[j]
+    count = 0
+    for i, x in enumerate(np.linspace(x_min, x_max, nx)):
+        if result[j, i, 0]!=0:
+            continue
+        scenario = dict(grid['scenario'])
+        scenario[x_name], scenario[y_name] = float(x), float(y)
+        try:
+            outcome, survival, max_e = run_cell(scenario, grid['escape_radius'], worker['backend'])
+        except (ValueError, ZeroDivisionError, FloatingPointError):
+            outcome, survival, max_e = 4, 0., np.inf ## Bodies at the same place
+        ## The outcome is written last : a cell whose outcome is
+        ## not 0 is complete, even if the map was interrupted
+        result[j, i, 1], result[j, i, 2] = survival, max_e
+        result[j, i, 0] = outcome
+        count += 1
+    result.flush()
+    return j, count
+
+
+#########################################################
+### Map
+#########################################################
+
+def stability_map(scenario, x, y, shape=(512, 512), output='stability_map', processes=None,
+                  backend=None, plot=True):
+
+    ##########
+    ##  Calculates (or finishes) a stability map
+    ##  scenario is a dictionnary (see CB_batch), tfin included
+    ##  x, y are (name of the field, minimum, maximum), for
+    ##  example ('x3', -20, 20)
+    ##  shape is the number of cells (along x, along y)
+    ##  output is the name of the files (.npy, .json, .png)
+    ##  processes is the number of processes (by default, the
+    ##  number of cores)
+    ##  backend is the integration backend (see CB_backend)
+    ##  plot allows to draw the map
+    ##  Returns the (ny, nx, 3) map : outcome, survival time
+    ##  and maximal eccentricity of each cell
+    ##########
+
+    grid = {'scenario' : scenario, 'x' : [x[0], float(x[1]), float(x[2])],
+            'y' : [y[0], float(y[1]), float(y[2])], 'shape' : [int(shape[0]), int(shape[1])],
+            'outcomes' : outcomes, 'fields' : fields}
+
+    ## Size of the biggest initial system (at a corner of the grid)
+    size = 0
+    for x_value in x[1:3]:
+        for y_value in y[1:3]:
+            corner = dict(scenario)
+            corner[x[0]], corner[y[0]] = x_value, y_value
+            params = CB_batch.scenario_parameters(corner)
+            size = max(size, params['r'], np.hypot(params['x3'], params['y3']))
+    grid['escape_radius'] = 3*size
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    ## Result file (a map with the same grid is resumed)
+    filename = output+'.npy'
+    if os.path.exists(filename) and os.path.exists(output+'.json'):
+        with open(output+'.json') as f:
+            if json.load(f)!=json.loads(json.dumps(grid)):
+                raise ValueError('%s is a map of another grid : remove it or choose another name' % filename)
+    else:
+        result = np.lib.format.open_memmap(filename, mode='w+', dtype=np.float64,
+                                           shape=(grid['shape'][1], grid['shape'][0], len(fields)))
+        del result
+        with open(output+'.json', 'w') as f:
+            json.dump(grid, f, indent=1)
+
+    result = np.load(filename, mmap_mode='r')
+    lines = [j for j in range(result.shape[0]) if np.any(result[j, :, 0]==0)]
+    done = result.shape[0]-len(lines)
+    del result
+
+    start = time.time()
+    if processes>1 and len(lines)>1:
+        pool = multiprocessing.Pool(min(processes, len(lines)), init_worker, (filename, grid, backend))
+        try:
+            for j, count in pool.imap_unordered(run_line, lines):
+                done += 1
+                print_progress(done, grid['shape'][1], start)
+        finally:
+            pool.terminate()
+    else:
+        init_worker(filename, grid, backend)
+        for j in lines:
+            run_line(j)
+            done += 1
+            print_progress(done, grid['shape'][1], start)
+        worker.clear()
+
+    result = np.load(filename)
+    if plot:
+        plot_map(result, grid, output+'.png')
+    return result
+
+def print_progress(done, total, start):
+    sys.stdout.write('\r%d/%d lines  %.0f s' % (done, total, time.time()-start))
+    if done==total:
+        sys.stdout.write('\n')
+    sys.stdout.flush()
+
+def plot_map(result, grid, filename):
+
+    ##########
+    ##  Draws the outcome, survival time and maximal
+    ##  eccentricity of each cell (file filename)
+    ##  result, grid are given by stability_map
+    ##########
+
+    import matplotlib
+    matplotlib.use('Agg') ## No window
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import ListedColormap, BoundaryNorm
+
+    (x_name, x_min, x_max), (y_name, y_min, y_max) = grid['x'], grid['y']
+    extent = [x_min, x_max, y_min, y_max]
+    options = {'origin' : 'lower', 'extent' : extent, 'aspect' : 'auto', 'interpolation' : 'nearest'}
+
+    fig = plt.figure(figsize=(18, 6))
+    axes = [fig.add_subplot(131), fig.add_subplot(132), fig.add_subplot(133)]
+    ax = axes[0]
+    colors = ListedColormap(['white', 'SteelBlue', 'orange', 'gold', 'red'])
+    image = ax.imshow(result[:, :, 0], cmap=colors, norm=BoundaryNorm(np.arange(-0.5, 5), 5), **options)
+    bar = fig.colorbar(image, ax=ax, ticks=range(5))
+    bar.ax.set_yticklabels(outcomes)
+    ax.set_title('outcome')
+
+    ax = axes[1]
+    image = ax.imshow(result[:, :, 1], cmap='viridis', **options)
+    fig.colorbar(image, ax=ax, label='years')
+    ax.set_title('survival time')
+
+    ax = axes[2]
+    image = ax.imshow(np.clip(result[:, :, 2], 0, 2), cmap='magma', vmin=0, vmax=2, **options)
+    fig.colorbar(image, ax=ax)
+    ax.set_title('maximal eccentricity of the third body')
+
+    for ax in axes:
+        ax.set_xlabel(x_name, fontsize='x-large')
+        ax.set_ylabel(y_name, fontsize='x-large')
+    fig.tight_layout()
+    fig.savefig(filename)
+    plt.close(fig)
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Stability map of the initial conditions of the third body.')
+    parser.add_argument('--preset', type=int, default=None, help='pre-registered scenario (see CB_core.presets)')
+    parser.add_argument('--scenario', default=None, help='JSON/TOML file, its first scenario is used (see CB_batch)')
+    parser.add_argument('--x', nargs=3, required=True, metavar=('FIELD', 'MIN', 'MAX'), help='field along the x-axis, for example x3 -20 20')
+    parser.add_argument('--y', nargs=3, required=True, metavar=('FIELD', 'MIN', 'MAX'), help='field along the y-axis, for example V3y -10 10')
+    parser.add_argument('-n', '--shape', nargs=2, type=int, default=[512, 512], metavar=('NX', 'NY'), help='number of cells')
+    parser.add_argument('--tfin', type=float, default=None, help='duration of each simulation (default : the one of the scenario)')
+    parser.add_argument('-o', '--output', default='stability_map', help='name of the files')
+    parser.add_argument('-j', '--processes', type=int, default=None, help='number of processes (default : number of cores)')
+    parser.add_argument('--backend', default=None, choices=sorted(CB_backend.backends), help='integration backend (default : fastest)')
+    args = parser.parse_args()
+
+    if args.scenario is not None:
+        scenario = CB_batch.load_scenarios(args.scenario)[0]
+    else:
+        scenario = {'preset' : args.preset if args.preset is not None else 1}
+    if args.tfin is not None:
+        scenario['tfin'] = args.tfin
+    x = (args.x[0], float(args.x[1]), float(args.x[2]))
+    y = (args.y[0], float(args.y[1]), float(args.y[2]))
+    stability_map(scenario, x, y, args.shape, args.output, args.processes, args.backend)
+    print('Map written in %s.npy and %s.png' % (args.output, args.output))
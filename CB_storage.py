@@ -0,0 +1,403 @@
+#########################################################
+#
+#   Title : Trajectory files for the "cosmic ballet" application
+#   Author: Joanne Breitfelder
+#
+#   Description :
+#   This script writes the trajectories directly to the
+#   disk, chunk by chunk, while they are calculated : the
+#   memory used stays the same whatever the length of the
+#   simulation.
+#
+#   A trajectory is stored in two files :
+#   - name.npy  : a standard numpy file (one line per step,
+#                 one column per element of q), which can be
+#                 read with np.load(name.npy, mmap_mode='r')
+#                 without loading it in memory
+#   - name.json : the parameters of the simulation (params
+#                 dictionnary, dt and number of steps), the
+#                 checks done during the integration and their
+#                 results (see wrapped_integrate)
+#
+#   During a long simulation, a checkpoint (name.checkpoint.json :
+#   current position/velocity vector, number of steps written, dt
+#   and params) can be written regularly. If the simulation is
+#   interrupted, resume_integration continues it from the last
+#   checkpoint and gives exactly the same trajectory as a
+#   simulation which was not interrupted :
+#   python CB_storage.py name.npy
+#   The checkpoint also records the checks done during the
+#   integration (options : events and conservation monitor,
+#   see wrapped_integrate) and their results, the checks are
+#   done again when the simulation is resumed (a simulation
+#   stopped by a collision stops at the same step).
+#
+#   The plotting functions of CB_tools accept the memory-mapped
+#   array : the pages they read belong to the system file cache,
+#   not to the application memory (a 80000 years run of the
+#   binary-planet scenario, 700 MB on the disk, is written and
+#   plotted with less than 100 MB of application memory).
+#
+#########################################################
+
+import json
+import os
+import sys
+import time
+import struct
+import numpy as np
+import CB_core
+import CB_monitor
+import CB_events
+
+## Trajectories bigger than this (in bytes) should go to the disk
+memory_limit = 2**28
+
+
+#########################################################
+### Writing
+#########################################################
+
+class TrajectoryWriter(object):
+
+    ##########
+    ##  Writes a trajectory to the disk, chunk by chunk
+    ##  filename is the .npy file (the .json file is put next to it)
+    ##  params contains a dictionnary of parameters
+    ##  dt is the step, number the expected number of steps
+    ##  n is the number of elements of the position/velocity vector
+    ##  count is the number of steps to keep in an existing file
+    ##  (0 : new file), the next steps are written after them
+    ##  options are the checks done during the integration (see
+    ##  wrapped_integrate), self.checks their results (see
+    ##  check_results) : both are written in the checkpoints
+    ##  and the .json file
+    ##  If less than number steps are written (interrupted
+    ##  simulation), the files are corrected by close()
+    ##  The .json file is removed while the .npy file is being
+    ##  written, and written again (in one go) by close() : a
+    ##  killed simulation never leaves a .json file describing
+    ##  another .npy file
+    ##########
+
+    header_size = 128 ## Fixed size : the shape can be corrected at the end
+
+    def __init__(self, filename, params, dt, number, n=12, count=0, options=None):
+        self.filename = filename
+        self.params, self.dt, self.number, self.n = params, dt, number, n
+        self.options, self.checks = options, None
+        self.count = count
+        self.meta_name = os.path.splitext(filename)[0]+'.json'
+        if os.path.exists(self.meta_name):
+            os.remove(self.meta_name)
+        if count>0:
+            self.file = open(filename, 'r+b')
+            self.file.truncate(self.header_size+count*n*8)
+        else:
+            self.file = open(filename, 'wb')
+        self.write_header(number)
+        self.file.seek(0, 2)
+
+    def write_header(self, number):
+
+        ##########
+        ##  Header of the .npy file (format version 1.0)
+        ##########
+
+        header = "{'descr': '<f8', 'fortran_order': False, 'shape': (%d, %d), }" % (number, self.n)
+        header = header.ljust(self.header_size-10-1)+'\n'
+        self.file.seek(0)
+        self.file.write(b'\x93NUMPY\x01\x00'+struct.pack('<H', len(header))+header.encode('latin1'))
+
+    def write(self, q_chunk):
+
+        ##########
+        ##  Appends a (steps, n) chunk of the trajectory
+        ##########
+
+        q_chunk = np.ascontiguousarray(q_chunk, dtype='<f8')
+        self.file.write(q_chunk.tobytes())
+        self.count += q_chunk.shape[0]
+
+    def checkpoint(self, q):
+
+        ##########
+        ##  Writes a checkpoint : the simulation can be resumed
+        ##  after the steps already written, from the
+        ##  position/velocity vector q
+        ##  The steps are on the disk before the checkpoint is
+        ##  replaced, and the checkpoint is replaced in one go :
+        ##  an interruption never leaves a wrong checkpoint
+        ##########
+
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        state = {'params' : self.params, 'dt' : self.dt, 'number' : self.number,
+                 'count' : self.count, 'q' : np.asarray(q, dtype=float).tolist(),
+                 'options' : self.options, 'checks' : self.checks}
+        write_atomic(checkpoint_name(self.filename), state)
+
+    def close(self):
+        if self.file.closed:
+            return
+        if self.count!=self.number:
+            self.write_header(self.count)
+        self.file.flush()
+        os.fsync(self.file.fileno()) ## The steps are on the disk before the .json file
+        self.file.close()
+        meta = {'params' : self.params, 'dt' : self.dt, 'number' : self.count,
+                'options' : self.options, 'checks' : self.checks}
+        write_atomic(self.meta_name, meta)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def checkpoint_name(filename):
+
+    ##########
+    ##  Checkpoint file of the trajectory filename
+    ##########
+
+    return os.path.splitext(filename)[0]+'.checkpoint.json'
+
+def write_atomic(filename, data):
+
+    ##########
+    ##  Writes data to a .json file in one go : the file is
+    ##  written next to it, then renamed
+    ##########
+
+    temporary = filename+'.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(data, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    replace_file(temporary, filename)
+
+def replace_file(temporary, filename):
+
+    ##########
+    ##  Renames the file temporary to filename (replacing it)
+    ##########
+
+    if hasattr(os, 'replace'):
+        os.replace(temporary, filename)
+    else:
+        if os.name=='nt' and os.path.exists(filename): ## rename does not replace on Windows
+            os.remove(filename)
+        os.rename(temporary, filename)
+
+
+#########################################################
+### Reading and integration
+#########################################################
+
+def open_trajectory(filename):
+
+    ##########
+    ##  Opens a trajectory written by TrajectoryWriter
+    ##  Returns the (number, n) memory-mapped array (nothing is
+    ##  loaded in memory) and the dictionnary of parameters
+    ##  (keys 'params', 'dt', 'number', 'options' and 'checks')
+    ##########
+
+    with open(os.path.splitext(filename)[0]+'.json') as f:
+        meta = json.load(f)
+    return np.load(filename, mmap_mode='r'), meta
+
+def wrapped_integrate(params, options=None, count=0, integrate=CB_core.integrate):
+
+    ##########
+    ##  Integration function with the checks of a simulation
+    ##  params contains a dictionnary of parameters
+    ##  options is a dictionnary (None : no check) :
+    ##  - 'events' : stop at collisions and escapes (see
+    ##    CB_events.default_events)
+    ##  - 'threshold', 'abort' : arguments of the conservation
+    ##    monitor (see CB_monitor), if 'threshold' is given
+    ##  count is the number of steps already done (the drift
+    ##  is measured from the initial vector of params)
+    ##  integrate is the integration function (see CB_backend)
+    ##  Returns the integration function, the monitor and the
+    ##  event detector (None if not used)
+    ##########
+
+    options = options or {}
+    monitor = detector = None
+    if 'threshold' in options:
+        monitor = CB_monitor.ConservationMonitor(params['mass'], threshold=options['threshold'],
+                                                 abort=options.get('abort', True))
+        monitor.start(np.array(CB_core.initial_vector(params), dtype=float))
+        monitor.step = count
+        integrate = monitor.wrap(integrate)
+    if options.get('events'):
+        detector = CB_events.EventDetector(CB_events.default_events(params))
+        detector.step = count
+        integrate = detector.wrap(integrate)
+    return integrate, monitor, detector
+
+def check_results(monitor, detector, previous=None):
+
+    ##########
+    ##  Results of the checks of a simulation (see
+    ##  wrapped_integrate) : dictionnary {'flagged' : first
+    ##  step where the drift passed the threshold, 'terminated' :
+    ##  record of the event which stopped the simulation}
+    ##  (None when it did not happen)
+    ##  previous are the results of the steps done before
+    ##########
+
+    previous = previous or {}
+    flagged = previous.get('flagged')
+    if flagged is None and monitor is not None:
+        flagged = monitor.flagged
+    return {'flagged' : flagged, 'terminated' : detector.terminated if detector is not None else None}
+
+def checks_until(checks, number):
+
+    ##########
+    ##  Results of the checks (see check_results) of the first
+    ##  number steps of a simulation
+    ##########
+
+    checks = checks or {}
+    flagged, terminated = checks.get('flagged'), checks.get('terminated')
+    return {'flagged' : flagged if flagged is not None and flagged<=number else None,
+            'terminated' : terminated if terminated is not None and terminated['step']<=number else None}
+
+def integrate_to_file(filename, q, params, dt, number, chunk=100000,
+                      integrate=CB_core.integrate, checkpoint_steps=None,
+                      checkpoint_time=None, start=0, options=None, checks=None, wrap=None):
+
+    ##########
+    ##  Solves the equations and streams the trajectory to the disk
+    ##  filename is the .npy file to write
+    ##  q is the initial position/velocity vector
+    ##  params contains a dictionnary of parameters
+    ##  dt and number are given by the step function
+    ##  chunk is the number of steps kept in memory
+    ##  integrate is the integration function (see CB_backend),
+    ##  the result is the same as integrate(q, m, dt, number)
+    ##  (shorter if integrate stops early, see CB_events)
+    ##  checkpoint_steps, checkpoint_time : a checkpoint is written
+    ##  every checkpoint_steps steps and/or checkpoint_time seconds
+    ##  (None : never), see resume_integration
+    ##  start is the number of steps already in the file (q is
+    ##  then the vector of the last one)
+    ##  options are the checks done during the integration (see
+    ##  wrapped_integrate), checks the results of the checks of
+    ##  the steps already in the file
+    ##  wrap is a function applied to the integration function
+    ##  with the checks (see CB_live.Producer.tee ; None : not
+    ##  used)
+    ##  Returns the result of open_trajectory
+    ##########
+
+    q = np.array(q, dtype=float)
+    integrate, monitor, detector = wrapped_integrate(params, options, start, integrate)
+    if wrap is not None:
+        integrate = wrap(integrate)
+    with TrajectoryWriter(filename, params, dt, number, q.shape[0], start, options) as writer:
+        if options is not None:
+            writer.checks = checks_until(checks, start)
+        done = last_step = start
+        last_time = time.time()
+        while done<number:
+            steps = min(chunk, number-done)
+            if checkpoint_steps is not None:
+                steps = min(steps, last_step+checkpoint_steps-done)
+            q_chunk = integrate(q, params['mass'], dt, steps)
+            writer.write(q_chunk)
+            if options is not None:
+                writer.checks = check_results(monitor, detector, checks)
+            done += q_chunk.shape[0]
+            if q_chunk.shape[0]<steps:
+                break  ## Stopped by an event (see CB_events)
+            q = q_chunk[-1]
+            if ((checkpoint_steps is not None and done-last_step>=checkpoint_steps)
+                or (checkpoint_time is not None and time.time()-last_time>=checkpoint_time)):
+                writer.checkpoint(q)
+                last_step, last_time = done, time.time()
+
+    ## The simulation is finished
+    if os.path.exists(checkpoint_name(filename)):
+        os.remove(checkpoint_name(filename))
+    return open_trajectory(filename)
+
+def extend_to_file(filename, q, params, dt, number, chunk=100000,
+                   integrate=CB_core.integrate, checkpoint_steps=None,
+                   checkpoint_time=None, options=None, reused=None, wrap=None):
+
+    ##########
+    ##  Same as integrate_to_file, but the trajectory already in
+    ##  filename is used if it is the one of the same system
+    ##  (same masses, initial vector, dt and checks : only tfin
+    ##  changed)
+    ##  - longer simulation : only the extra steps are calculated
+    ##    and added to the file (unless the trajectory of the
+    ##    file was stopped by an event)
+    ##  - shorter simulation : the beginning of the trajectory is
+    ##    returned (the file is not changed)
+    ##  reused is a function called with the steps read from
+    ##  the file before the extra steps are calculated, wrap is
+    ##  the one of integrate_to_file (None : not used)
+    ##  The result is exactly the one of integrate_to_file
+    ##  Returns the (number, n) memory-mapped array and the
+    ##  dictionnary of parameters of the file, whose checks are
+    ##  the ones of the steps returned
+    ##########
+
+    if os.path.exists(filename) and os.path.exists(os.path.splitext(filename)[0]+'.json'):
+        q_old, meta = open_trajectory(filename)
+        if (meta['dt']==dt and list(meta['params']['mass'])==list(params['mass'])
+            and CB_core.initial_vector(meta['params'])==list(np.asarray(q, dtype=float))
+            and meta.get('options')==options and q_old.shape[0]>0):
+            checks = meta.get('checks')
+            if meta['number']>=number or (checks or {}).get('terminated') is not None:
+                if reused is not None:
+                    reused(q_old[0:number])
+                meta['checks'] = checks_until(checks, number) if options is not None else None
+                return q_old[0:number], meta
+            if reused is not None:
+                reused(q_old)
+            q_last = np.array(q_old[-1])
+            del q_old ## The file is closed before being written
+            return integrate_to_file(filename, q_last, params, dt, number, chunk, integrate,
+                                     checkpoint_steps, checkpoint_time, meta['number'], options, checks, wrap)
+    return integrate_to_file(filename, q, params, dt, number, chunk, integrate,
+                             checkpoint_steps, checkpoint_time, options=options, wrap=wrap)
+
+def resume_integration(filename, chunk=100000, integrate=CB_core.integrate,
+                       checkpoint_steps=None, checkpoint_time=None):
+
+    ##########
+    ##  Continues an interrupted integrate_to_file from its
+    ##  last checkpoint (the steps written after it are
+    ##  calculated again), with the same checks (options of
+    ##  the checkpoint, see wrapped_integrate)
+    ##  filename is the .npy file
+    ##  integrate is the integration function, without checks
+    ##  The other arguments are the ones of integrate_to_file
+    ##  Returns the result of open_trajectory
+    ##########
+
+    with open(checkpoint_name(filename)) as f:
+        state = json.load(f)
+    return integrate_to_file(filename, state['q'], state['params'], state['dt'], state['number'],
+                             chunk, integrate, checkpoint_steps, checkpoint_time, state['count'],
+                             state.get('options'), state.get('checks'))
+
+
+if __name__=='__main__':
+    filename = sys.argv[1] if len(sys.argv)>1 else 'trajectory.npy'
+    with open(checkpoint_name(filename)) as f:
+        planned = json.load(f)['number']
+    q_all, meta = resume_integration(filename, checkpoint_time=60.)
+    if meta['number']<planned:
+        print('%s : %d steps (stopped by an event)' % (filename, meta['number']))
+    else:
+        print('%s : %d steps' % (filename, meta['number']))
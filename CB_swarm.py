@@ -0,0 +1,280 @@
+#########################################################
+#
+#   Title : Swarms of test particles for the "cosmic ballet" application
+#   Author: Joanne Breitfelder
+#
+#   Description :
+#   This script follows a whole swarm of massless test
+#   particles (debris disk, comet cloud) around the binary
+#   system (restricted 3 bodies problem) : the particles
+#   are attracted by the two bodies of the binary but do
+#   not attract them, like the comet of the third scenario.
+#
+#   The binary is then a Kepler orbit, calculated once and
+#   exactly (see CB_symplectic.kepler_drift), and all the
+#   particles are advanced together by the Runge-Kutta
+#   method of CB_core, with vectorized accelerations : a
+#   swarm of 100000 particles costs much less than 100000
+#   simulations.
+#
+#   Shapes :
+#   - P is a (N, 4) array, one particle per line (x, y,
+#     Vx, Vy)
+#   - the binary is a (steps, 4) array (x1, y1, x2, y2)
+#
+#   How to use it :
+#   python CB_swarm.py --preset 3 -n 100000 --cloud 0.001 0.01 -o cloud.png
+#   python CB_swarm.py --preset 2 -n 10000 --disk 25 60 -o disk.png
+#   (python CB_swarm.py -h for all the options)
+#
+#########################################################
+
+import argparse
+import numpy as np
+import CB_core
+import CB_symplectic
+
+
+#########################################################
+### The binary
+#########################################################
+
+def binary_orbit(q, m, times):
+
+    ##########
+    ##  Positions of the binary at the given times (exact
+    ##  Kepler orbit, the third body being massless)
+    ##  q is the initial position/velocity vector (only the
+    ##  first two bodies are used)
+    ##  m contains the bodies masses
+    ##  times is an array of times (from the initial vector)
+    ##  Returns a (len(times), 4) array : x1, y1, x2, y2
+    ##########
+
+    G=9.86e-5 ## In the right units
+
+    q = np.asarray(q, dtype=float)
+    M1 = float(m[0]+m[1])
+    x, y, vx, vy = q[2]-q[0], q[3]-q[1], q[8]-q[6], q[9]-q[7]
+    center = (m[0]*q[0:2]+m[1]*q[2:4])/M1
+    velocity = (m[0]*q[6:8]+m[1]*q[8:10])/M1
+
+    binary = np.empty((len(times), 4))
+    for i, t in enumerate(times):
+        ## Each time from the initial vector (no accumulated error)
+        rx, ry = CB_symplectic.kepler_drift(x, y, vx, vy, G*M1, t)[0:2]
+        cx, cy = center+velocity*t
+        binary[i] = [cx-m[1]/M1*rx, cy-m[1]/M1*ry, cx+m[0]/M1*rx, cy+m[0]/M1*ry]
+    return binary
+
+
+#########################################################
+### Equation resolution
+#########################################################
+
+def accelerations(x, y, b, m):
+
+    ##########
+    ##  Accelerations of the particles
+    ##  x, y are (N,) arrays of positions
+    ##  b is the position of the binary (x1, y1, x2, y2)
+    ##  m contains the bodies masses
+    ##  Same force law as CB_core.diff_eq, without the third body
+    ##########
+
+    G=9.86e-5 ## In the right units
+
+    dx1, dy1, dx2, dy2 = b[0]-x, b[1]-y, b[2]-x, b[3]-y
+    d1, d2 = dx1*dx1+dy1*dy1, dx2*dx2+dy2*dy2
+    m1m3 = G*m[0]/(d1*np.sqrt(d1)) ## d**3, faster than **1.5
+    m2m3 = G*m[1]/(d2*np.sqrt(d2))
+    return m1m3*dx1+m2m3*dx2, m1m3*dy1+m2m3*dy2
+
+def rKN_swarm(X, b0, bh, b1, m, dt):
+
+    ##########
+    ##  Runge-Kutta method applied to all the particles
+    ##  X is the (4, N) array of positions and velocities
+    ##  b0, bh, b1 are the positions of the binary at the
+    ##  beginning, the middle and the end of the step
+    ##  m contains the bodies masses
+    ##########
+
+    x, y, vx, vy = X
+    k1 = [vx, vy]+list(accelerations(x, y, b0, m))
+    X1 = [X[k]+k1[k]*(dt*0.5) for k in range(4)]
+    k2 = X1[2:4]+list(accelerations(X1[0], X1[1], bh, m))
+    X2 = [X[k]+k2[k]*(dt*0.5) for k in range(4)]
+    k3 = X2[2:4]+list(accelerations(X2[0], X2[1], bh, m))
+    X3 = [X[k]+k3[k]*dt for k in range(4)]
+    k4 = X3[2:4]+list(accelerations(X3[0], X3[1], b1, m))
+    for k in range(4):
+        X[k] += (k1[k]+2*(k2[k]+k3[k])+k4[k])*(dt/6)
+
+def integrate_swarm(P, q, m, dt, number, every=1, summary=False):
+
+    ##########
+    ##  Integrates all the particles around the binary
+    ##  P is a (N, 4) array of initial positions/velocities
+    ##  q is the initial position/velocity vector of the
+    ##  scenario (its first two bodies are the binary)
+    ##  m contains the bodies masses (the third one is not used)
+    ##  dt and number are given by the step function
+    ##  every : the positions are kept every this number of steps
+    ##  Returns the binary ((number//every, 4) array, see
+    ##  binary_orbit) and :
+    ##  - if summary is False, the (N, number//every, 4) states
+    ##    of the particles
+    ##  - if summary is True (the states are not kept, for big
+    ##    swarms), a dictionnary of per-particle results :
+    ##      'final'    : (N, 4) final states
+    ##      'min_dist' : (N, 2) minimal distances to the two
+    ##                   bodies of the binary
+    ##      'max_dist' : (N,) maximal distance to the center
+    ##                   of mass of the binary
+    ##########
+
+    X = np.array(np.asarray(P, dtype=float).T) ## Contiguous lines x, y, Vx, Vy
+    N = X.shape[1]
+    binary = binary_orbit(q, m, np.arange(2*number+1)*(dt*0.5)) ## Each half step
+    M1 = float(m[0]+m[1])
+
+    if summary:
+        min_dist = np.empty((N, 2))
+        min_dist[:] = np.inf
+        max_dist = np.zeros(N)
+    else:
+        P_all = np.empty((N, number//every, 4))
+
+    for i in range(number):
+        b0, bh, b1 = binary[2*i], binary[2*i+1], binary[2*i+2]
+        rKN_swarm(X, b0, bh, b1, m, dt)
+        if summary:
+            np.minimum(min_dist[:, 0], np.hypot(X[0]-b1[0], X[1]-b1[1]), out=min_dist[:, 0])
+            np.minimum(min_dist[:, 1], np.hypot(X[0]-b1[2], X[1]-b1[3]), out=min_dist[:, 1])
+            np.maximum(max_dist, np.hypot(X[0]-(m[0]*b1[0]+m[1]*b1[2])/M1,
+                                          X[1]-(m[0]*b1[1]+m[1]*b1[3])/M1), out=max_dist)
+        elif (i+1)%every==0:
+            P_all[:, (i+1)//every-1] = X.T
+
+    binary = binary[2*every::2*every]
+    if summary:
+        return binary, {'final' : X.T.copy(), 'min_dist' : min_dist, 'max_dist' : max_dist}
+    return binary, P_all
+
+
+#########################################################
+### Initial conditions
+#########################################################
+
+def disk(q, m, n, r_min, r_max, seed=None):
+
+    ##########
+    ##  Particles on circular orbits around the binary
+    ##  q is the initial position/velocity vector of the scenario
+    ##  m contains the bodies masses
+    ##  n is the number of particles
+    ##  r_min, r_max are the limits of the disk
+    ##  seed allows to draw the same disk again
+    ##  Returns the (n, 4) array of the particles
+    ##########
+
+    G=9.86e-5 ## In the right units
+
+    rng = np.random.RandomState(seed)
+    M1 = float(m[0]+m[1])
+    center = (m[0]*q[0:2]+m[1]*q[2:4])/M1
+    velocity = (m[0]*q[6:8]+m[1]*q[8:10])/M1
+    r = np.sqrt(rng.uniform(r_min**2, r_max**2, n)) ## Uniform surface density
+    angle = rng.uniform(0, 2*np.pi, n)
+    v = np.sqrt(G*M1/r)
+    return np.column_stack((center[0]+r*np.cos(angle), center[1]+r*np.sin(angle),
+                            velocity[0]-v*np.sin(angle), velocity[1]+v*np.cos(angle)))
+
+def cloud(q, n, spread, velocity_spread, seed=None):
+
+    ##########
+    ##  Particles around the initial position and velocity of
+    ##  the third body (normal distributions)
+    ##  q is the initial position/velocity vector of the scenario
+    ##  n is the number of particles
+    ##  spread, velocity_spread are the standard deviations
+    ##  of the positions and velocities
+    ##  seed allows to draw the same cloud again
+    ##  Returns the (n, 4) array of the particles
+    ##########
+
+    rng = np.random.RandomState(seed)
+    P = np.empty((n, 4))
+    P[:, 0:2] = q[4:6]+rng.normal(0, spread, (n, 2))
+    P[:, 2:4] = q[10:12]+rng.normal(0, velocity_spread, (n, 2))
+    return P
+
+
+#########################################################
+### Plot
+#########################################################
+
+def plot_swarm(binary, P, params, filename, P_start=None):
+
+    ##########
+    ##  Draws the orbits of the binary and the particles at
+    ##  the end (file filename)
+    ##  binary is given by integrate_swarm
+    ##  P is the (N, 4) array of the final particles
+    ##  params contains a dictionnary of parameters
+    ##  P_start allows to draw the initial particles too
+    ##########
+
+    import matplotlib
+    matplotlib.use('Agg') ## No window
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(8, 8))
+    ax = fig.add_subplot(111)
+    size = max(0.5, 100./np.sqrt(P.shape[0])) ## Smaller points for big swarms
+    if P_start is not None:
+        ax.scatter(P_start[:, 0], P_start[:, 1], s=size, c='LightGray', lw=0, label='initial particles')
+    ax.scatter(P[:, 0], P[:, 1], s=size, c='SteelBlue', lw=0, label='particles after %g years' % params['tfin'])
+    for k, color in [(0, 'red'), (1, 'orange')]:
+        ax.plot(binary[:, 2*k], binary[:, 2*k+1], color=color, label=params['names'][k])
+
+    ## The view is centred on the binary, the lost particles are not shown
+    finite = P[np.all(np.isfinite(P[:, 0:2]), axis=1)]
+    points = np.vstack((binary[:, 0:2], binary[:, 2:4], finite[:, 0:2]))
+    low, high = np.percentile(points, 1, axis=0), np.percentile(points, 99, axis=0)
+    center, half = 0.5*(low+high), 0.55*max(high-low)
+    ax.set_xlim(center[0]-half, center[0]+half)
+    ax.set_ylim(center[1]-half, center[1]+half)
+    ax.set_xlabel('x (AU)')
+    ax.set_ylabel('y (AU)')
+    ax.set_title('%d test particles around %s and %s' % (P.shape[0], params['names'][0], params['names'][1]))
+    ax.legend(loc='upper right', fontsize='small', markerscale=max(1, 10/size))
+    fig.savefig(filename)
+    plt.close(fig)
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Swarm of massless test particles around the binary.')
+    parser.add_argument('--preset', type=int, default=3, help='pre-registered scenario (see CB_core.presets)')
+    parser.add_argument('-n', '--particles', type=int, default=10000, help='number of particles')
+    parser.add_argument('--cloud', nargs=2, type=float, metavar=('SPREAD', 'VSPREAD'), help='cloud around the third body (standard deviations of the positions and velocities)')
+    parser.add_argument('--disk', nargs=2, type=float, metavar=('RMIN', 'RMAX'), help='disk of circular orbits around the binary')
+    parser.add_argument('--tfin', type=float, default=None, help='duration of the simulation (default : the one of the scenario)')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the random initial conditions')
+    parser.add_argument('-o', '--output', default='swarm.png', help='image file')
+    args = parser.parse_args()
+
+    params = CB_core.preset_parameters(args.preset)
+    if args.tfin is not None:
+        params['tfin'] = args.tfin
+    q = np.asarray(CB_core.initial_vector(params), dtype=float)
+    if args.disk is not None:
+        P = disk(q, params['mass'], args.particles, args.disk[0], args.disk[1], args.seed)
+    else:
+        spread = args.cloud if args.cloud is not None else (0.01*params['r'], 0.01*np.hypot(q[10], q[11]))
+        P = cloud(q, args.particles, spread[0], spread[1], args.seed)
+    dt, number = CB_core.step(params['r'], params['tfin'])
+    binary, results = integrate_swarm(P, q, params['mass'], dt, number, summary=True)
+    plot_swarm(binary, results['final'], params, args.output, P_start=P)
+    print('%d particles, %d steps, image written in %s' % (args.particles, number, args.output))
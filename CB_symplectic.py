@@ -0,0 +1,265 @@
+#########################################################
+#
+#   Title : Symplectic integrators for the "cosmic ballet" application
+#   Author: Joanne Breitfelder
+#
+#   Description :
+#   This script solves the 3 bodies problem with symplectic
+#   methods : the kick-drift-kick leapfrog (2nd order) and
+#   its Yoshida compositions (4th and 6th order).
+#   Contrary to the Runge-Kutta method of CB_core, their
+#   energy error stays bounded instead of drifting, which
+#   allows bigger steps for long simulations (centuries).
+#
+#   The position/velocity vector has the same layout as
+#   in CB_core : the first half of q contains the positions
+#   and the second half the velocities (q[0:6] and q[6:12]
+#   for 3 bodies, see also CB_nbody).
+#
+#   For 3 bodies whose first two are a binary (all the
+#   scenarios of the application), the Wisdom-Holman method
+#   follows the two Kepler orbits (the binary, and the third
+#   body around it) exactly and only integrates their
+#   perturbations : when they are small (Sun-Jupiter, Earth-
+#   Moon with a far or light third body), the step can be
+#   10 to 100 times bigger for the same accuracy.
+#
+#########################################################
+
+import math
+import numpy as np
+import CB_core
+
+
+#########################################################
+### Composition coefficients
+#########################################################
+
+## Each method is a sequence of leapfrog sub-steps, given
+## as fractions of the step dt
+x1 = 2.**(1./3)
+y6 = [0.784513610477560, 0.235573213359357, -1.17767998417887]
+METHODS = {'leapfrog' : [1.],
+           'yoshida4' : [1./(2-x1), -x1/(2-x1), 1./(2-x1)],
+           'yoshida6' : y6+[1-2*sum(y6)]+y6[::-1]}
+del x1, y6
+
+
+#########################################################
+### Main functions
+#########################################################
+
+def integrate_symplectic(q, m, dt, number, method='leapfrog', fx=CB_core.diff_eq):
+
+    ##########
+    ##  Solves the equations over a given number of steps
+    ##  q is the initial position/velocity vector
+    ##  m contains the bodies masses
+    ##  dt and number are given by the step function (the
+    ##  step can be several times bigger than for rKN)
+    ##  method is 'leapfrog', 'yoshida4' or 'yoshida6'
+    ##  fx is the differential function, only its accelerations
+    ##  (second half of fx(q, m), functions of the positions)
+    ##  are used
+    ##  Returns a (number, len(q)) array, one line per step
+    ##########
+
+    if method not in METHODS:
+        raise ValueError('Unknown method %r, choose between %s' % (method, sorted(METHODS)))
+    weights = METHODS[method]
+
+    q = np.array(q, dtype=float)
+    n = q.shape[0]//2
+    x, v = q[0:n], q[n:] ## Views on q : updating them updates q
+    a = fx(q, m)[n:]
+    q_all = np.empty((number, q.shape[0]))
+    for i in range(number):
+        for w in weights:
+            h = w*dt
+            v += a*(h*0.5) ## Kick
+            x += v*h       ## Drift
+            a = fx(q, m)[n:]
+            v += a*(h*0.5) ## Kick
+        q_all[i] = q
+    return q_all
+
+
+#########################################################
+### Wisdom-Holman method (hierarchical 3 bodies)
+#########################################################
+
+def stumpff(z):
+
+    ##########
+    ##  Stumpff functions c0, c1, c2, c3 of z
+    ##  (series when z is small, to keep their precision)
+    ##########
+
+    if abs(z)<0.1:
+        c = [1., 1., 0.5, 1./6]
+        terms = [1., 1., 0.5, 1./6]
+        for k in range(1, 8):
+            for n in range(4):
+                terms[n] *= -z/((2*k+n)*(2*k+n-1))
+                c[n] += terms[n]
+        return c
+    if z>0:
+        s = math.sqrt(z)
+        c0, c1 = math.cos(s), math.sin(s)/s
+    else:
+        s = math.sqrt(-z)
+        c0, c1 = math.cosh(s), math.sinh(s)/s
+    return [c0, c1, (1-c0)/z, (1-c1)/z]
+
+def kepler_drift(x, y, vx, vy, mu, dt, iterations=50):
+
+    ##########
+    ##  Exact motion during dt on the Kepler orbit of position
+    ##  (x, y) and velocity (vx, vy) around a mass G*M = mu
+    ##  (universal variables : any orbit, elliptic or not)
+    ##  Returns the new x, y, vx, vy
+    ##########
+
+    r0 = math.sqrt(x*x+y*y)
+    eta = x*vx+y*vy
+    beta = 2*mu/r0-(vx*vx+vy*vy)  ## > 0 for an elliptic orbit
+    zeta = mu-beta*r0
+
+    ## Whole periods are removed from dt
+    t = dt
+    if beta>0:
+        period = 2*math.pi*mu/beta**1.5
+        t = math.fmod(dt, period)
+
+    ## Kepler equation in the universal anomaly s (Laguerre-Conway
+    ## iterations, which converge even for very eccentric orbits)
+    s = t/r0
+    for i in range(iterations):
+        c0, c1, c2, c3 = stumpff(beta*s*s)
+        g1, g2, g3 = s*c1, s*s*c2, s*s*s*c3
+        f = r0*s+eta*g2+zeta*g3-t
+        fp = r0+eta*g1+zeta*g2
+        fpp = eta*c0+zeta*g1
+        root = math.sqrt(abs(16*fp*fp-20*f*fpp))
+        ds = -5*f/(fp+math.copysign(root, fp))
+        s += ds
+        if abs(ds)<=1e-15*abs(s):
+            break
+
+    c0, c1, c2, c3 = stumpff(beta*s*s)
+    g1, g2, g3 = s*c1, s*s*c2, s*s*s*c3
+    r = r0+eta*g1+zeta*g2
+    f, g = 1-mu*g2/r0, t-mu*g3
+    fd, gd = -mu*g1/(r0*r), 1-mu*g2/r
+    return f*x+g*vx, f*y+g*vy, fd*x+gd*vx, fd*y+gd*vy
+
+def to_jacobi(q, m):
+
+    ##########
+    ##  Jacobi coordinates of a 3 bodies position/velocity
+    ##  vector : center of mass, binary (body 2 relative to
+    ##  body 1) and third body relative to the center of mass
+    ##  of the binary
+    ##  Returns (x, y, vx, vy) of these 3 vectors
+    ##########
+
+    M1, M = m[0]+m[1], m[0]+m[1]+m[2]
+    vectors = []
+    for k in [0, 6]:
+        x0, y0, x1, y1, x2, y2 = q[k:k+6]
+        center = ((m[0]*x0+m[1]*x1)/M1, (m[0]*y0+m[1]*y1)/M1)
+        vectors.append([((M1*center[0]+m[2]*x2)/M, (M1*center[1]+m[2]*y2)/M),
+                        (x1-x0, y1-y0), (x2-center[0], y2-center[1])])
+    return [vectors[0][i]+vectors[1][i] for i in range(3)]
+
+def from_jacobi(jacobi, m):
+
+    ##########
+    ##  Inverse of to_jacobi : returns the position/velocity
+    ##  vector (3 bodies)
+    ##########
+
+    M1, M = m[0]+m[1], m[0]+m[1]+m[2]
+    (X, Y, VX, VY), (x1, y1, vx1, vy1), (x2, y2, vx2, vy2) = jacobi
+    q = np.empty(12)
+    for k, (cx, cy, ax, ay, bx, by) in [(0, (X, Y, x1, y1, x2, y2)), (6, (VX, VY, vx1, vy1, vx2, vy2))]:
+        q[k:k+6] = [cx-m[1]/M1*ax-m[2]/M*bx, cy-m[1]/M1*ay-m[2]/M*by,
+                    cx+m[0]/M1*ax-m[2]/M*bx, cy+m[0]/M1*ay-m[2]/M*by,
+                    cx+M1/M*bx, cy+M1/M*by]
+    return q
+
+def interaction(jacobi, m):
+
+    ##########
+    ##  Accelerations of the binary and of the third body
+    ##  (Jacobi coordinates) which are not part of their two
+    ##  Kepler orbits : the perturbation of the binary by the
+    ##  third body, and the difference between the real
+    ##  attraction of the binary on the third body and the one
+    ##  of a single mass at its center of mass
+    ##  Returns (ax1, ay1, ax2, ay2)
+    ##########
+
+    G=9.86e-5 ## In the right units
+    M1, M = m[0]+m[1], m[0]+m[1]+m[2]
+    x1, y1 = jacobi[1][0:2]
+    x2, y2 = jacobi[2][0:2]
+
+    ## Third body relative to each body of the binary
+    dx0, dy0 = x2+m[1]/M1*x1, y2+m[1]/M1*y1
+    dx1, dy1 = x2-m[0]/M1*x1, y2-m[0]/M1*y1
+    d0 = (dx0*dx0+dy0*dy0)**1.5
+    d1 = (dx1*dx1+dy1*dy1)**1.5
+    d = (x2*x2+y2*y2)**1.5
+
+    ## The binary : difference of the attractions of the third body
+    ax1, ay1 = G*m[2]*(dx1/d1-dx0/d0), G*m[2]*(dy1/d1-dy0/d0)
+    ## The third body : attraction of the binary minus the Kepler one
+    ## (M/M1 : reduced mass of the outer orbit)
+    ax2 = -G*M/M1*(m[0]*dx0/d0+m[1]*dx1/d1-M1*x2/d)
+    ay2 = -G*M/M1*(m[0]*dy0/d0+m[1]*dy1/d1-M1*y2/d)
+    return ax1, ay1, ax2, ay2
+
+def integrate_wisdom_holman(q, m, dt, number):
+
+    ##########
+    ##  Solves the equations over a given number of steps with
+    ##  the Wisdom-Holman method : the Kepler orbit of the
+    ##  binary (bodies 1 and 2) and the one of the third body
+    ##  around the binary are followed exactly (kepler_drift),
+    ##  and the perturbation of each orbit by the other body is
+    ##  added as kicks (interaction). The error is proportional
+    ##  to the perturbation : for a hierarchical system (a far
+    ##  or small third body), dt can be 10 to 100 times bigger
+    ##  than the one of the step function. A close encounter
+    ##  of the third body with one body of the binary breaks
+    ##  this splitting : use the Runge-Kutta method (CB_core)
+    ##  for such scenarios.
+    ##  q is the initial position/velocity vector (3 bodies)
+    ##  m contains the bodies masses
+    ##  Returns a (number, 12) array, one line per step
+    ##########
+
+    G=9.86e-5 ## In the right units
+    mu1, mu2 = G*(m[0]+m[1]), G*(m[0]+m[1]+m[2])
+    center, binary, third = [list(v) for v in to_jacobi(np.asarray(q, dtype=float), m)]
+
+    q_all = np.empty((number, 12))
+    a = interaction([center, binary, third], m)
+    for i in range(number):
+        ## Kick (half step), Kepler drift, kick (half step)
+        binary[2] += a[0]*dt*0.5
+        binary[3] += a[1]*dt*0.5
+        third[2] += a[2]*dt*0.5
+        third[3] += a[3]*dt*0.5
+        binary[:] = kepler_drift(binary[0], binary[1], binary[2], binary[3], mu1, dt)
+        third[:] = kepler_drift(third[0], third[1], third[2], third[3], mu2, dt)
+        center[0] += center[2]*dt
+        center[1] += center[3]*dt
+        a = interaction([center, binary, third], m)
+        binary[2] += a[0]*dt*0.5
+        binary[3] += a[1]*dt*0.5
+        third[2] += a[2]*dt*0.5
+        third[3] += a[3]*dt*0.5
+        q_all[i] = from_jacobi([center, binary, third], m)
+    return q_all
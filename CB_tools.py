@@ -8,6 +8,8 @@
 #   needed to solve the 3 bodies problem,
 #   as well as to visualize the trajectories of
 #   3 bodies in gravitational interaction.
+#   The equations are solved by CB_core (numpy only) ;
+#   matplotlib is only imported when something is plotted.
 #
 #   How to use the application :
 #   - All you need is a working python 2.7 distribution.
@@ -16,89 +18,24 @@
 #
 #########################################################
 
-import numpy as np
-from scipy import *
-import pylab
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_pdf import PdfPages
-from pylab import *
 import os
-from matplotlib.collections import LineCollection
-import matplotlib.colors as mcol
+import sys
+import numpy as np
+import CB_lod
+from CB_core import presets, parameters, preset_parameters, initial_vector
+from CB_core import diff_eq, rKN, integrate, energy, angular_momentum, step, step2, limits
+
+## Resolution of the rasterized trajectories in vector files, and
+## number of segments from which a trajectory is rasterized
+raster_dpi = 200
+raster_segments = 10000
 
 
 #########################################################
-### Main functions (equation resolution and plotting)
+### Main functions (plotting)
 #########################################################
 
-def diff_eq(q, m):
-    
-    ##########
-    ##  Differential equations for the 3 bodies problem
-    ##  q is a position/velocity vector
-    ##  m contains the bodies masses
-    ##########
-    
-    c=3./2.
-    G=9.86e-5 ## In the right units
-    
-    m1m2=((q[2]-q[0])*(q[2]-q[0])+(q[3]-q[1])*(q[3]-q[1]))**c
-    m1m3=((q[4]-q[0])*(q[4]-q[0])+(q[5]-q[1])*(q[5]-q[1]))**c
-    m2m3=((q[4]-q[2])*(q[4]-q[2])+(q[5]-q[3])*(q[5]-q[3]))**c
-
-    qp = []
-    
-    qp.append(q[6])
-    qp.append(q[7])
-    
-    qp.append(q[8])
-    qp.append(q[9])
-    qp.append(q[10])
-    qp.append(q[11])
-    
-    qp.append(G*(m[1]*(q[2]-q[0])/m1m2+m[2]*(q[4]-q[0])/m1m3))
-    qp.append(G*(m[1]*(q[3]-q[1])/m1m2+m[2]*(q[5]-q[1])/m1m3))
-    
-    qp.append(G*(m[0]*(q[0]-q[2])/m1m2+m[2]*(q[4]-q[2])/m2m3))
-    qp.append(G*(m[0]*(q[1]-q[3])/m1m2+m[2]*(q[5]-q[3])/m2m3))
-    
-    qp.append(G*(m[0]*(q[0]-q[4])/m1m3+m[1]*(q[2]-q[4])/m2m3))
-    qp.append(G*(m[0]*(q[1]-q[5])/m1m3+m[1]*(q[3]-q[5])/m2m3))
-
-    qp = array(qp)
-    return qp
-
-def rKN(x, m, fx, n, dt):
-    
-    ##########
-    ##  Runge-Kutta method in dimension n
-    ##  x is a position/velocity vector
-    ##  m contains the bodies masses
-    ##  fx is the differential function to solve
-    ##  dt is the step for the successive iterations 
-    ##########
-    
-    k1, k2, k3, k4 = [], [], [], []
-    xk = []
-    for i in range(n):
-        k1.append(fx(x, m)[i]*dt)
-    for i in range(n):
-        xk.append(x[i]+k1[i]*0.5) 
-    for i in range(n):
-        k2.append(fx(xk, m)[i]*dt)
-    for i in range(n):
-        xk[i] = x[i]+k2[i]*0.5
-    for i in range(n):
-        k3.append(fx(xk, m)[i]*dt)
-    for i in range(n):
-        xk[i] = x[i]+k3[i]
-    for i in range(n):
-        k4.append(fx(xk, m)[i]*dt)
-    for i in range(n):
-        x[i] = x[i]+(k1[i]+2*(k2[i]+k3[i])+k4[i])/6
-    return x
-
-def animation(q=[], params={}, save_files=False, directory=os.getcwd()):
+def animation(q=[], params={}, save_files=False, directory=os.getcwd(), blit=True):
     
     ##########
     ##  Plotting the simulation
@@ -106,18 +43,74 @@ def animation(q=[], params={}, save_files=False, directory=os.getcwd()):
     ##  params contains a dictionnary of parameters
     ##  save_files allows to save all successive images
     ##  directory is the path to save the images
+    ##  blit allows to redraw only the moving artists
+    ##  (not used when the images are saved)
+    ##  To make a movie without opening a window, see CB_export
+    ##  To show it while the equations are solved, see CB_live
     ##########
     
+    import matplotlib.pyplot as plt
+
     ## If needed, creation of the directory to save the files
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-    xmax, xmin, ymax, ymin = limits(q)
-    number = step(params['r'], params['tfin'])[1]
+    number = len(q[0]) ## Less than planned if the simulation was stopped (see CB_events)
+    dt = step(params['r'], params['tfin'])[0]
 
     ## Initializing the plot
+    ## If possible, only the moving artists are redrawn at each frame
+    ## over a copy of the static background (blitting)
+    blit = blit and not save_files
     fig = plt.figure(0, figsize=(12, 6))
     plt.clf()
+    artists = animation_figure(fig, q, params, animated=blit)
+    
+    ## Opening the interactive mode
+    plt.ion()
+    plt.show()
+    fig.canvas.draw()
+    if blit:
+        background = fig.canvas.copy_from_bbox(fig.bbox)
+        
+    ## Plotting the actual data
+    for j, i in enumerate(frame_schedule(number)):
+
+        ## The figure is redrawn once per frame, below (in interactive
+        ## mode, each modified artist would redraw it)
+        plt.ioff()
+        animation_frame(q, params, dt, i, artists)
+
+        if blit:
+            fig.canvas.restore_region(background)
+            for artist in artists:
+                fig.axes[0].draw_artist(artist)
+            fig.canvas.blit(fig.bbox)
+        else:
+            fig.canvas.draw()
+        plt.ion()
+        fig.canvas.flush_events()
+        
+        if save_files:
+            fig.savefig(directory+'/'+str(j)+'.png')
+
+def animation_figure(fig, q, params, animated=False):
+
+    ##########
+    ##  Prepares the figure of the animation
+    ##  fig is an empty figure
+    ##  q is a position/velocity vector
+    ##  params contains a dictionnary of parameters
+    ##  animated is True if the moving artists are drawn
+    ##  separately (blitting)
+    ##  Returns the moving artists (the 3 trajectories, the
+    ##  3 points and the title), updated by animation_frame
+    ##########
+
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+
+    xmax, xmin, ymax, ymin = limits(q)
     ax = fig.add_subplot(111)
     
     ## Setting the axis for the plot
@@ -147,52 +140,60 @@ def animation(q=[], params={}, save_files=False, directory=os.getcwd()):
     
     ## Creating a collection of points (with good marker size)
     ms = marker_size(params['mass'], 4., 8.)
-    point1, = ax.plot([], [], '-o', color='orange', ms=ms[0], label=params['names'][0])
-    point2, = ax.plot([], [], '-o', color='SteelBlue', ms=ms[1], label=params['names'][1])
-    point3, = ax.plot([], [], '-o', color='red', ms=ms[2], label=params['names'][2])
-    
-    ## Opening the interactive mode
-    plt.ion()
-    plt.show()
-        
-    ## Plotting the actual data
-    j=-1
-    time=float(params['tfin'])/float(number)
-    for i in range(number):
-        del ax.collections[:]
-        number_=float(number)/149
-        number_=int(number_)
-        if i%number_==0:
-            j=j+1
-            n=300
-            
-            if i <= n:              
-                colormap_plot(np.array(q[0][0:i]), np.array(q[1][0:i]), Oranges_new())                
-                colormap_plot(np.array(q[2][0:i]), np.array(q[3][0:i]), 'Blues')
-                colormap_plot(np.array(q[4][0:i]), np.array(q[5][0:i]), Reds_new())
-                
-            else:
-                colormap_plot(np.array(q[0][i-n:i]), np.array(q[1][i-n:i]), Oranges_new())
-                colormap_plot(np.array(q[2][i-n:i]), np.array(q[3][i-n:i]), 'Blues')
-                colormap_plot(np.array(q[4][i-n:i]), np.array(q[5][i-n:i]), Reds_new())
-            
-            point1.set_data(q[0][i], q[1][i])
-            point2.set_data(q[2][i], q[3][i])
-            point3.set_data(q[4][i], q[5][i])
-            
-            plt.legend(fontsize='medium', loc='upper right', ncol=2, frameon=False, numpoints=1)    
-            plt.title('trajectories calculated over ' + str(int(time)) + ' years', fontsize='x-large')
-          
-            fig.canvas.draw()
-            fig.canvas.update()
-            fig.canvas.flush_events()
-            
-            if save_files:
-                fig.savefig(directory+'/'+str(j)+'.png')
-        
-        time+=float(params['tfin'])/float(number)
+    point1, = ax.plot([], [], '-o', color='orange', ms=ms[0], label=params['names'][0], animated=animated)
+    point2, = ax.plot([], [], '-o', color='SteelBlue', ms=ms[1], label=params['names'][1], animated=animated)
+    point3, = ax.plot([], [], '-o', color='red', ms=ms[2], label=params['names'][2], animated=animated)
+    
+    ## The trajectories are drawn by persistent collections,
+    ## updated at each frame
+    trails = []
+    for colormap in [Oranges_new(), 'Blues', Reds_new()]:
+        lc = LineCollection([], cmap=plt.get_cmap(colormap), animated=animated)
+        lc.set_clim(0, 1)
+        trails.append(ax.add_collection(lc))
+    
+    ax.legend(fontsize='medium', loc='upper right', ncol=2, frameon=False, numpoints=1)
+    title = ax.set_title('', fontsize='x-large', animated=animated)
+    return trails+[point1, point2, point3, title]
 
-def final_trajectories(q=[], params={}, save_files=False, directory=os.getcwd(), filename='final_trajectory.png'):
+def animation_frame(q, params, dt, i, artists, n=300, offset=0):
+
+    ##########
+    ##  Updates the moving artists for the step i
+    ##  q is a position/velocity vector
+    ##  params contains a dictionnary of parameters
+    ##  dt is the step
+    ##  artists are given by animation_figure
+    ##  n is the number of steps of the visible trajectories
+    ##  offset is the step of the first element of q (q can
+    ##  be a part of the trajectory, see CB_export)
+    ##########
+
+    trails, points, title = artists[0:3], artists[3:6], artists[6]
+    j = i-offset
+    for k, lc in enumerate(trails):
+        x = np.array(q[2*k][max(j-n, 0):j])
+        y = np.array(q[2*k+1][max(j-n, 0):j])
+        lc.set_segments(segments(x, y))
+        lc.set_array(np.linspace(0, 1, x.shape[0])[:-1])
+        points[k].set_data([q[2*k][j]], [q[2*k+1][j]])
+    
+    time = dt*(i+1)
+    title.set_text('trajectories calculated over ' + str(int(time)) + ' years')
+
+def frame_schedule(number, frames=150):
+
+    ##########
+    ##  Steps shown by the animation
+    ##  number is the number of steps
+    ##  frames is the approximate number of images
+    ##########
+
+    every = max(int(float(number)/(frames-1)), 1)
+    return range(0, number, every)
+
+def final_trajectories(q=[], params={}, save_files=False, directory=os.getcwd(), filename='final_trajectory.png',
+                       dpi=None):
     
     ##########
     ##  Plotting the final trajectory
@@ -200,18 +201,49 @@ def final_trajectories(q=[], params={}, save_files=False, directory=os.getcwd(),
     ##  params contains a dictionnary of parameters
     ##  save_files allows to save all successive images
     ##  directory is the path to save the images
+    ##  filename gives the format of the file : in a vector
+    ##  format (.pdf, .svg, .eps), the trajectories are
+    ##  rasterized (see trajectory_figure)
+    ##  dpi is the resolution of the file (by default, the one
+    ##  of the figure, or raster_dpi for a vector format)
     ##########
     
+    import matplotlib.pyplot as plt
+
     ## If needed, creation of the directory to save the files
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-    xmax, xmin, ymax, ymin = limits(q)
-    number = step(params['r'], params['tfin'])[1]
+    rasterized = save_files and vector_format(filename)
+    if rasterized and dpi is None:
+        dpi = raster_dpi
 
     ## Initializing the plot
     fig = plt.figure(1, figsize=(12, 6))
     plt.clf()
+    trajectory_figure(fig, q, params, rasterized, dpi)
+  
+    if save_files:
+        fig.savefig(directory+'/'+filename, dpi=dpi)
+
+def trajectory_figure(fig, q, params, rasterized=False, dpi=None):
+
+    ##########
+    ##  Draws the final trajectories in the empty figure fig
+    ##  q is a position/velocity vector
+    ##  params contains a dictionnary of parameters
+    ##  rasterized allows to draw the trajectories as an image
+    ##  in a vector file (only the ones with more than
+    ##  raster_segments segments) : the axes and the annotations
+    ##  stay vectors, and the size of the file does not depend
+    ##  on the number of steps
+    ##  dpi is the resolution of the file (the trajectories are
+    ##  simplified to the size of its pixels, see CB_lod)
+    ##########
+
+    xmax, xmin, ymax, ymin = limits(q)
+    number = len(q[0])
+
     ax = fig.add_subplot(111)
     
     ## Setting the axis for the plot
@@ -245,26 +277,72 @@ def final_trajectories(q=[], params={}, save_files=False, directory=os.getcwd(),
     point2, = ax.plot([], [], '-o', color='SteelBlue', ms=ms[1], label=params['names'][1])
     point3, = ax.plot([], [], '-o', color='red', ms=ms[2], label=params['names'][2])
     
-    ## Plotting the actual data
-    colormap_plot(np.array(q[0]), np.array(q[1]), Oranges_new())                
-    colormap_plot(np.array(q[2]), np.array(q[3]), 'Blues')
-    colormap_plot(np.array(q[4]), np.array(q[5]), Reds_new())
+    ## Plotting the actual data : only the points visible at the
+    ## resolution of the figure are kept (see CB_lod), so that
+    ## the plotting time does not depend on the number of steps
+    tol_pixel = CB_lod.pixel_size(ax)
+    if dpi is not None:
+        tol_pixel = tol_pixel*fig.dpi/dpi
+    for k, colormap in enumerate([Oranges_new(), 'Blues', Reds_new()]):
+        index = CB_lod.select_level(CB_lod.pyramid(q[2*k], q[2*k+1]), tol_pixel)
+        lc = colormap_plot(np.asarray(q[2*k])[index], np.asarray(q[2*k+1])[index], colormap,
+                           index/float(max(number-1, 1)), ax=ax)
+        lc.set_rasterized(rasterized and len(index)>raster_segments)
 
     point1.set_data(q[0][number-1], q[1][number-1])
     point2.set_data(q[2][number-1], q[3][number-1])
     point3.set_data(q[4][number-1], q[5][number-1])
   
-    plt.legend(fontsize='medium', loc='upper right', ncol=2, frameon=False, numpoints=1)    
-    plt.title('trajectories calculated over ' + str(params['tfin']) + ' years', fontsize='x-large')
-  
-    if save_files:
-        fig.savefig(directory+'/'+filename)
+    ax.legend(fontsize='medium', loc='upper right', ncol=2, frameon=False, numpoints=1)    
+    ax.set_title('trajectories calculated over ' + str(params['tfin']) + ' years', fontsize='x-large')
+
+def report(pages, filename, dpi=None):
+
+    ##########
+    ##  Writes the final trajectories of many simulations in
+    ##  one PDF file, one page per simulation
+    ##  pages gives the (q, params) of each page (a list, or a
+    ##  generator : each trajectory is only needed while its
+    ##  page is written)
+    ##  filename is the name of the PDF file
+    ##  dpi is the resolution of the trajectories (see
+    ##  trajectory_figure ; by default raster_dpi)
+    ##  The same figure is used for all the pages
+    ##  Returns the number of pages
+    ##########
+
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    if dpi is None:
+        dpi = raster_dpi
+    fig = plt.figure(figsize=(12, 6))
+    count = 0
+    pdf = PdfPages(filename)
+    try:
+        for q, params in pages:
+            fig.clf()
+            trajectory_figure(fig, q, params, rasterized=True, dpi=dpi)
+            pdf.savefig(fig, dpi=dpi)
+            count += 1
+    finally:
+        pdf.close()
+        plt.close(fig)
+    return count
 
 
 #########################################################
 ### Useful little tools
 #########################################################
 
+def vector_format(filename):
+
+    ##########
+    ##  True if the file is saved in a vector format
+    ##########
+
+    return os.path.splitext(filename)[1].lower() in ['.pdf', '.svg', '.svgz', '.eps', '.ps']
+
 def format_e(n):
     
     ##########
@@ -296,68 +374,40 @@ def marker_size(m, ms_min=4, ms_max=8):
         ms[index_middle] = ms_min + (ms_max-ms_min)*((m[index_middle]-min(m))/(max(m)-min(m)))
     return ms
 
-def step(r, tfin):
-    
-    ##########
-    ##  Defines the step and the number of iterations
-    ##  These parameters depend on the distance r between bodies
-    ##  the 2 bodies orbiting around each other
-    ##  tfin indicates the length of the simulation, in years
-    ##########
-    
-    dt = 0.005*r**(1./3)
-    number = int(tfin/dt)
-    return dt, number
-
-def step2(m, tfin):
-    
-    ##########
-    ##  Defines the step and the number of iterations
-    ##  These parameters depend on the minimal mass of the 3 bodies
-    ##  m contains the bodies masses
-    ##  tfin indicates the length of the simulation, in years
-    ##########
-    
-    if min(m)<100.0:                ## Earth-like planets and big moons
-        dt = 1.0/100
-        number = int(tfin/dt)
-    if min(m)<0.001:                ## Comets, small bodies
-        dt = 1.0/500
-        number = int(tfin/dt)
-    else:                           ## Stars and big planets
-        dt = 1.0/50
-        number = int(tfin/dt)
-    return dt, number
-
-
-def limits(q):
+def colormap_plot(x, y, colormap, t=None, ax=None):
     
     ##########
-    ##  Defines the limits for the final plot
-    ##  q is a position/velocity vector
+    ##  Plots a line with a color defined by a colormap
+    ##  x, y are the variables to plot
+    ##  colormap is a python colormap
+    ##  t gives the color of each point (between 0 and 1),
+    ##  by default from 0 (first point) to 1 (last point)
+    ##  ax are the axes (by default, the current ones)
     ##########
     
-    xmax = max(max(q[0]), max(q[2]), max(q[4]))
-    xmin = min(min(q[0]), min(q[2]), min(q[4]))
-    ymax = max(max(q[1]), max(q[3]), max(q[5]))
-    ymin = min(min(q[1]), min(q[3]), min(q[5]))
-    return xmax, xmin, ymax, ymin
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+    if t is None:
+        t = np.linspace(0,1,x.shape[0])
+    if ax is None:
+        ax = plt.gca()
+    lc = LineCollection(segments(x, y), cmap=plt.get_cmap(colormap))
+    lc.set_array(t[:-1])
+    lc.set_clim(0, 1)
+    return ax.add_collection(lc)
 
-def colormap_plot(x, y, colormap):
+def segments(x, y):
     
     ##########
-    ##  Plots a line with a color defined by a colormap
+    ##  Segments joining the successive points of a line
     ##  x, y are the variables to plot
-    ##  colormap is a python colormap
     ##########
     
-    t = np.linspace(0,1,x.shape[0])
     points = np.array([x, y]).transpose().reshape(-1,1,2)
-    segs = np.concatenate([points[:-1],points[1:]],axis=1)
-    lc = LineCollection(segs, cmap=plt.get_cmap(colormap))
-    lc.set_array(t)
-    plt.gca().add_collection(lc)
-    return plt.gca().add_collection(lc)
+    return np.concatenate([points[:-1],points[1:]],axis=1)
+
+## The colormaps are only created once
+colormaps = {}
 
 def Oranges_new():
     
@@ -366,10 +416,13 @@ def Oranges_new():
     ##  subset of the Oranges colormap
     ##########
     
-    lvTmp = np.linspace(0.0, 0.7, 100)
-    cmTmp = plt.cm.Oranges(lvTmp)
-    newOranges = mcol.ListedColormap(cmTmp)
-    return newOranges
+    import matplotlib.pyplot as plt
+    import matplotlib.colors as mcol
+    if 'Oranges_new' not in colormaps:
+        lvTmp = np.linspace(0.0, 0.7, 100)
+        cmTmp = plt.cm.Oranges(lvTmp)
+        colormaps['Oranges_new'] = mcol.ListedColormap(cmTmp)
+    return colormaps['Oranges_new']
 
 def Reds_new():
     
@@ -378,10 +431,13 @@ def Reds_new():
     ##  subset of the Reds colormap
     ##########
 
-    lvTmp = np.linspace(0.0, 0.7, 100)
-    cmTmp = plt.cm.Reds(lvTmp)
-    newReds = mcol.ListedColormap(cmTmp)
-    return newReds
+    import matplotlib.pyplot as plt
+    import matplotlib.colors as mcol
+    if 'Reds_new' not in colormaps:
+        lvTmp = np.linspace(0.0, 0.7, 100)
+        cmTmp = plt.cm.Reds(lvTmp)
+        colormaps['Reds_new'] = mcol.ListedColormap(cmTmp)
+    return colormaps['Reds_new']
 
 def error(answer, options):
     
@@ -14,17 +14,18 @@
 #   - All you need is a working python 2.7 distribution.
 #   - Put Cosmic_ballet.py and CB_tools.py in your working directory
 #   - Run Cosmic_ballet.py and enjoy !
+#   - To run many scenarios without any question, see CB_batch.py
+#   - To map the outcomes of a plane of initial conditions, see CB_stability.py
+#   - To follow a swarm of massless particles around the binary, see CB_swarm.py
 #   
 #########################################################
 
 import numpy as np
-from scipy import *
-import pylab
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_pdf import PdfPages
-from pylab import *
 import os
 import CB_tools
+import CB_storage
+import CB_cache
+import CB_live
 import time
 
 
@@ -36,6 +37,7 @@ G=9.86e-5 ## In the right units
 # Distances are in UA, time in year, masses in Earth masses
 option1, option2, option3 = False, False, False
 again=1
+cache = CB_cache.TrajectoryCache() ## Trajectories already calculated
 
 
 #########################################################
@@ -188,37 +190,15 @@ elif display==2: animation, final_trajectories = False, True
 ### Initial conditions 
 #########################################################
 
-## Pre-defined options :
+## Pre-defined options (see CB_tools.presets) :
 
-if option1 :
-    ## Betelgeuse visiting the Jupiter-Sun system
-    names = ['Sun', 'Jupiter', 'Betelgeuse']
-    r = 5.202
-    e = 0
-    m = [3.33e5, 3.1e2, 2.5e6]
-    V3x, V3y = 2, 0
-    x3, y3 = -6e1, 3e1
-    tfin = 80.
-
-if option2:
-    ## Earth-like planet evolving in a binary system
-    names = ['Star1', 'Star2', 'Planet']
-    r = 10.5
-    e = 0.5
-    m = [4e5, 4e5, 1]
-    V3x, V3y = 0, -8.7
-    x3, y3 = 4, 0
-    tfin = 80.
-
-if option3 :
-    ## Comet 67P entering the Earth-Moon system!
-    names = ['Earth', 'Moon', 'Comet 67P']
-    r = 0.00257
-    e = 0.0549
-    m = [1, 0.0123, 1.67e-12]
-    V3x, V3y = 0.02, 0.005
-    x3, y3 = -0.08, 0
-    tfin = 15.0
+for k, option in enumerate([option1, option2, option3]):
+    if option:
+        preset = CB_tools.presets[k+1]
+        names, r, e, m = list(preset['names']), preset['r'], preset['e'], list(preset['mass'])
+        V3x, V3y = preset['V3x'], preset['V3y']
+        x3, y3 = preset['x3'], preset['y3']
+        tfin = preset['tfin']
 
 
 #########################################################
@@ -226,27 +206,8 @@ if option3 :
 #########################################################
 
 while(again==1):
-    params = {'names' : names,
-        'r' : r,
-        'e' : e,
-        'mass' : m,
-        'V3x' : V3x,
-        'V3y' : V3y,
-        'x3' : x3,
-        'y3' : y3,
-        'tfin' : tfin,
-        'x1' : 0,
-        'y1' : 0,
-        'y2' : 0,
-        'V1x' : 0,
-        'V2x' : 0,
-        'V1y' : sqrt((1+e)*G*(m[1]**2/(m[0]+m[1]))/(r*(1-e))),
-        'V2y' : -sqrt((1+e)*G*(m[0]**2/(m[0]+m[1]))/(r*(1-e))),
-        'x2' : r*(1-e)}
-    
-    q = [params['x1'], params['y1'], params['x2'], params['y2'],
-         params['x3'], params['y3'], params['V1x'], params['V1y'],
-         params['V2x'], params['V2y'], params['V3x'], params['V3y']]
+    params = CB_tools.parameters(names, r, e, m, V3x, V3y, x3, y3, tfin)
+    q = CB_tools.initial_vector(params)
     
     
     #########################################################
@@ -256,31 +217,58 @@ while(again==1):
     ## Defining the step and number of iterations
     dt, number = CB_tools.step(params['r'], params['tfin'])
         
-    q0, q1, q2, q3, q4, q5 = [], [], [], [], [], []
-    V1, V2, V3 = [], [], []
-    for i in range(number):
-        q_new = CB_tools.rKN(q, params['mass'],
-                        CB_tools.diff_eq, 12, dt) ## Equations solving
-        q = q_new 
-        q0.append(q[0])
-        q1.append(q[1])
-        q2.append(q[2])
-        q3.append(q[3])
-        q4.append(q[4])
-        q5.append(q[5])
-        V1.append(sqrt(q[6]**2+q[7]**2))
-        V2.append(sqrt(q[6]**2+q[7]**2))
-        V3.append(sqrt(q[6]**2+q[7]**2))
+    ## Equations solving (long simulations are streamed to the disk,
+    ## with a checkpoint every minute : if the simulation is interrupted,
+    ## run "python CB_storage.py trajectory.npy" to finish it)
+    ## When only the duration changes, the previous trajectory is
+    ## extended or shortened instead of being calculated again
+    ## The conservation of the energy and angular momentum is checked
+    ## The simulation stops if two bodies collide or if a body escapes
+    options = {'events' : True, 'threshold' : 1e-4, 'abort' : False}
+    if number*len(q)*8 <= CB_storage.memory_limit:
+        def solve(tee=None, reused=None):
+            return cache.integrate(q, params, dt, number, CB_tools.integrate, options=options,
+                                   reused=reused, wrap=tee)
+    else:
+        def solve(tee=None, reused=None):
+            trajectory, meta = CB_storage.extend_to_file(os.path.join(os.getcwd(), 'trajectory.npy'),
+                                                         q, params, dt, number, integrate=CB_tools.integrate,
+                                                         checkpoint_time=60., options=options,
+                                                         reused=reused, wrap=tee)
+            return trajectory, meta['checks']
+    if animation:
+        ## The animation is shown while the equations are solved
+        ## (see CB_live), closing it stops the simulation
+        producer = CB_live.Producer(q, params['mass'], dt, number, solve=solve)
+        CB_live.live_animation(producer, params)
+        trajectory, checks = producer.result
+    else:
+        trajectory, checks = solve()
+    steps = len(trajectory)
+    if checks['terminated'] is not None:
+        bodies = [names[k] for k in checks['terminated']['bodies']]
+        if len(bodies)==2:
+            print 'Boom! '+bodies[0]+' and '+bodies[1]+' collided after '+str(int(steps*dt))+' years.'
+        else:
+            print bodies[0]+' left the system after '+str(int(steps*dt))+' years, the simulation stops there.'
+        print ''
+    elif steps<number:
+        print 'The animation was closed : the simulation stopped after '+str(int(steps*dt))+' years.'
+        print ''
+    if steps<number:
+        params['tfin'] = steps*dt ## Duration shown by the plots
+    if checks['flagged'] is not None:
+        print 'Careful! The energy of the bodies is not conserved after '+str(int(checks['flagged']*dt))+' years :'
+        print 'they came too close to each other, the trajectories may be wrong.'
+        print ''
     
-    q_all = [q0, q1, q2, q3, q4, q5]
+    q_all = trajectory[:, 0:6].T
     
     
     #########################################################
     ### Plotting the results and ask the user for new parameters
     #########################################################
        
-    if animation :
-        CB_tools.animation(q_all, params, save_files=False)
     if final_trajectories :
         print 'Do you want to save the graph?'
         print 'If yes, it will be saved in your current working directory.'